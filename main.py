@@ -1,30 +1,33 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from pydantic import BaseModel
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from src.processor import DocumentProcessor
-from langsmith import Client
-from langsmith.run_trees import RunTree
+from src.answer_cache import AnswerCache, replay_chunks
+from src.ingest_jobs import IngestJobManager, COMPLETED
+from src.model_registry import model_registry
+from src.tracing import tracer, Span
+from src.retriever import DOCUMENT_FIELDS
+from src.startup import readiness
 from dotenv import load_dotenv
+import base64
+import hashlib
 import json
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 import re
+import uuid
 import asyncio
 import os
-from langchain.callbacks.manager import CallbackManager
-from langchain.callbacks.base import BaseCallbackHandler
-from src.logger import Logger
+from langchain_core.callbacks import BaseCallbackHandler
+from src.logger import Logger, SAMPLED
 
 logger = Logger.get_logger('main')
 load_dotenv()
 
 logger.info("Starting promtior Chatbot application")
-langsmith_client = Client()
 
 app = FastAPI()
 
@@ -40,6 +43,9 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+URL_INGEST_WAIT_SECONDS = float(os.getenv("URL_INGEST_WAIT_SECONDS", "20"))
+DOCUMENTS_MAX_PAGE_SIZE = int(os.getenv("DOCUMENTS_MAX_PAGE_SIZE", "500"))
 logger.info(f"Upload directory created at {UPLOAD_DIR}")
 
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
@@ -58,7 +64,8 @@ if ENVIRONMENT == "production":
 else:
     document_processor = DocumentProcessor(model="llama3.2")
 
-processed_documents = []
+answer_cache = AnswerCache()
+ingest_jobs = IngestJobManager(document_processor)
 
 @app.get("/environment")
 async def get_environment():
@@ -66,6 +73,24 @@ async def get_environment():
     logger.info(f"Environment status requested: {ENVIRONMENT}")
     return {"environment": ENVIRONMENT}
 
+@app.get("/stats")
+async def get_stats():
+    """Expose cache and pipeline counters"""
+    return {
+        "embedding_cache": document_processor.embedding_cache.stats(),
+        "embedding_pipeline": document_processor.retriever.embedding_pipeline.stats(),
+        "vector_backend": document_processor.retriever.vector_stats(),
+        "lexical_index": document_processor.retriever.lexical_index.stats(),
+        "near_duplicates": document_processor.retriever.near_duplicate_stats(),
+        "context_builder": document_processor.context_builder.stats(),
+        "retrieval_cache": document_processor.retriever.retrieval_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "model_registry": model_registry.stats(),
+        "tracing": tracer.stats(),
+        "crawl_cache": document_processor.document_loader.crawl_cache.stats(),
+        "ingest_jobs": ingest_jobs.stats(),
+    }
+
 @app.get("/check-api-key")
 async def check_api_key():
     """Check if OpenAI API key is configured and valid"""
@@ -74,31 +99,117 @@ async def check_api_key():
     logger.info(f"API key check requested. Valid: {is_valid}")
     return {"valid": is_valid}
 
+def safe_upload_name(filename: Optional[str]) -> str:
+    """Base name of an uploaded file with anything but letters, digits, '.', '_' and '-' replaced."""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", Path(filename or "").name).lstrip(".")
+    return name or "upload.pdf"
+
 @app.post("/upload-pdf")
 async def upload_pdf(file: UploadFile = File(...)):
     try:
-        logger.info(f"Processing PDF upload: {file.filename}")
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        logger.info("Processing PDF upload: %s", file.filename)
+        filename = safe_upload_name(file.filename)
+        tmp_path = UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as buffer:
+                # Copy in fixed-size chunks so the whole upload is never in memory
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    await asyncio.to_thread(buffer.write, chunk)
+            # One file per distinct content, so a job still parsing an earlier
+            # upload of the same name never sees its file overwritten
+            file_path = UPLOAD_DIR / f"{digest.hexdigest()[:16]}-{filename}"
+            os.replace(tmp_path, file_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
         
-        logger.info(f"PDF saved to {file_path}")
-        docs = await document_processor.load_and_split_documents([file_path])
-        processed_documents.extend(docs)
+        logger.info("PDF saved to %s", file_path)
+        # Re-uploading the same bytes while a job is still running joins that job;
+        # chunks are recorded under the upload name so a new version replaces the old one
+        job = ingest_jobs.submit(
+            "file", [str(file_path)], key=f"file:{file_path}", source_name=str(UPLOAD_DIR / filename)
+        )
         
-        logger.info(f"Successfully processed {file.filename} into {len(docs)} chunks")
-        return {"message": f"Successfully processed {file.filename}", "chunks": len(docs)}
+        return {
+            "message": f"Queued {file.filename} for processing",
+            "job_id": job.id,
+            "status": job.status
+        }
     except Exception as e:
-        logger.error(f"Error processing PDF upload: {str(e)}")
+        logger.error("Error processing PDF upload: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    logger.info("Cancellation requested for ingestion job %s", job_id)
+    return job.to_dict()
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
 @app.get("/documents")
-async def get_documents():
-    logger.info(f"Retrieving document list. Total chunks: {len(processed_documents)}")
+async def get_documents(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1),
+    source: Optional[str] = None,
+    type: Optional[str] = None,
+    fields: str = ",".join(DOCUMENT_FIELDS),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """Page through indexed chunks, or stream them all as NDJSON with format=ndjson"""
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(selected) - set(DOCUMENT_FIELDS)
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {', '.join(DOCUMENT_FIELDS)}")
+    limit = min(limit, DOCUMENTS_MAX_PAGE_SIZE)
+    offset = decode_cursor(cursor)
+    retriever = document_processor.retriever
+
+    if format == "ndjson":
+        async def export():
+            position = offset
+            while True:
+                rows, has_more = await asyncio.to_thread(
+                    retriever.list_documents, DOCUMENTS_MAX_PAGE_SIZE, position, source, type, selected
+                )
+                for row in rows:
+                    yield json.dumps(row) + "\n"
+                if not has_more:
+                    break
+                position += len(rows)
+
+        logger.info("Exporting documents as NDJSON from offset %s", offset)
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+
+    rows, has_more = await asyncio.to_thread(retriever.list_documents, limit, offset, source, type, selected)
+    total_chunks = await asyncio.to_thread(retriever.count_documents)
+    logger.info("Retrieved %d documents from offset %d. Total chunks: %d", len(rows), offset, total_chunks, extra=SAMPLED)
     return {
-        "total_chunks": len(processed_documents),
-        "documents": [doc.page_content for doc in processed_documents]
+        "total_chunks": total_chunks,
+        "documents": rows,
+        "next_cursor": encode_cursor(offset + len(rows)) if has_more else None
     }
 
 @app.post("/chat")
@@ -116,78 +227,85 @@ async def chat_endpoint(chat_message: ChatMessage):
             
             # Check if trying to use local model
             if chat_message.model in ["llama3.2", "deepseek-r1:7b"]:
-                logger.warning(f"Attempted to use local model {chat_message.model} in production")
+                logger.warning("Attempted to use local model %s in production", chat_message.model)
                 raise HTTPException(
                     status_code=400,
                     detail="Local models are not available in production environment"
                 )
             
-        logger.info(f"Received chat request with model: {chat_message.model}")
-        run_tree = RunTree(
-            name="Chat Request",
-            inputs={"message": chat_message.message, "model": chat_message.model},
-            project_name="promtior-rag",
-        )
+        logger.info("Received chat request with model: %s", chat_message.model, extra=SAMPLED)
+        run_tree = tracer.start_span("Chat Request", {"message": chat_message.message, "model": chat_message.model})
 
         class LangSmithCallback(BaseCallbackHandler):
-            def __init__(self, run_tree: RunTree):
+            def __init__(self, run_tree: Span):
                 super().__init__()
                 self.run_tree = run_tree
                 
             def on_llm_start(self, *args, **kwargs):
-                if not self.run_tree.start_time:
-                    self.run_tree.post()
-                logger.info("LLM processing started")
+                logger.info("LLM processing started", extra=SAMPLED)
                 
             def on_llm_end(self, *args, **kwargs):
                 if not self.run_tree.end_time:
                     self.run_tree.end()
-                    self.run_tree.post()
-                logger.info("LLM processing completed")
+                logger.info("LLM processing completed", extra=SAMPLED)
                 
             def on_llm_error(self, error, *args, **kwargs):
                 if not self.run_tree.end_time:
                     self.run_tree.end(error=str(error))
-                    self.run_tree.post()
-                logger.error(f"LLM error occurred: {str(error)}")
+                logger.error("LLM error occurred: %s", error)
 
-        callback_manager = CallbackManager([LangSmithCallback(run_tree)])
-        
-        # Initialize appropriate chat model based on selection
-        if chat_message.model in ["gpt-4o", "gpt-4o-mini"]:
-            logger.info(f"Using OpenAI model: {chat_message.model}")
-            chat_model = ChatOpenAI(
-                model=chat_message.model,
-                api_key=os.getenv("OPENAI_API_KEY"),
-                streaming=True,
-                callback_manager=callback_manager
-            )
-        else:
-            logger.info(f"Using Ollama model: {chat_message.model}")
-            chat_model = ChatOllama(
-                model=chat_message.model,
-                base_url=os.getenv("OLLAMA_BASE_URL"),
-                streaming=True,
-                callback_manager=callback_manager
-            )
+        # Shared client from the registry; callbacks are attached per request
+        chat_model = model_registry.get_chat_model(chat_message.model)
+        stream_config = {"callbacks": [LangSmithCallback(run_tree)]}
+        logger.info("Using chat model: %s", chat_message.model, extra=SAMPLED)
 
         messages = []
         url_match = re.search(r'@(https?://[^\s]+)', chat_message.message)
         
         async def process_stream():
+            cache_embedding = None
+            corpus_version = document_processor.retriever.corpus_version
+            if not url_match and answer_cache.enabled:
+                cached_answer = answer_cache.get_exact(chat_message.message, chat_message.model, corpus_version)
+                # Lexical mode is for a slow or unavailable embedder, so it only gets exact hits
+                if (cached_answer is None and document_processor.vectorstore
+                        and document_processor.retriever.retrieval_mode != "lexical"):
+                    try:
+                        # Goes through the query embedding cache, so retrieval reuses it
+                        cache_embedding = (await document_processor.retriever.embed_queries([chat_message.message]))[0]
+                        cached_answer = answer_cache.get_similar(cache_embedding, chat_message.model, corpus_version)
+                    except Exception as e:
+                        logger.warning("Answer cache lookup failed: %s", e)
+                if cached_answer is not None:
+                    for piece in replay_chunks(cached_answer):
+                        yield f"data: {json.dumps({'content': piece})}\n\n"
+                        await asyncio.sleep(0)
+                    if not run_tree.end_time:
+                        run_tree.end(outputs={"cached": True})
+                    logger.info("Chat answered from cache")
+                    return
+
             if url_match:
                 url = url_match.group(1)
                 try:
-                    logger.info(f"Processing URL: {url}")
-                    yield f"data: {json.dumps({'status': 'processing'})}\n\n"
+                    logger.info("Processing URL: %s", url)
+                    job = ingest_jobs.submit("url", [url])
+                    yield f"data: {json.dumps({'status': 'processing', 'job_id': job.id})}\n\n"
                     
-                    docs = await document_processor.load_and_split_documents([url])
+                    # The job keeps running in the background if the wait times out
+                    finished = await ingest_jobs.wait(job, timeout=URL_INGEST_WAIT_SECONDS)
                     question = chat_message.message.replace(url_match.group(0), "").strip()
-                    logger.info(f"URL processed into {len(docs)} document chunks")
+                    if finished and job.status != COMPLETED:
+                        raise RuntimeError("; ".join(job.errors) or f"ingestion {job.status}")
+                    if finished:
+                        logger.info("URL processed into %s document chunks", job.chunks_done)
+                    else:
+                        logger.info("URL ingestion job %s still running, answering from current index", job.id)
+                        yield f"data: {json.dumps({'status': job.status, 'job_id': job.id})}\n\n"
                     
-                    if docs and document_processor.vectorstore:
+                    if document_processor.vectorstore:
                         context, analysis = await document_processor.get_relevant_context_async(question)
-                        logger.info(f"Retrieved context with analysis: {analysis}")
+                        logger.info("Retrieved context with analysis: %s", analysis, extra=SAMPLED)
                         rag_prompt = document_processor.get_rag_prompt(
                             question=question, 
                             context=context
@@ -197,17 +315,16 @@ async def chat_endpoint(chat_message: ChatMessage):
                         logger.warning("No documents processed from URL")
                         messages.append(SystemMessage(content="Failed to process the URL. Please try again."))
                 except Exception as e:
-                    logger.error(f"Error processing URL: {str(e)}")
+                    logger.error("Error processing URL: %s", e)
                     messages.append(SystemMessage(content=f"Error processing URL: {str(e)}"))
                     if not run_tree.end_time:
                         run_tree.end(error=str(e))
-                        run_tree.post()
                     return
             else:
                 if document_processor.vectorstore:
-                    logger.info("Processing question with existing vectorstore")
+                    logger.info("Processing question with existing vectorstore", extra=SAMPLED)
                     context, analysis = await document_processor.get_relevant_context_async(chat_message.message)
-                    logger.info(f"Retrieved context with analysis: {analysis}")
+                    logger.info("Retrieved context with analysis: %s", analysis, extra=SAMPLED)
                     rag_prompt = document_processor.get_rag_prompt(
                         question=chat_message.message,
                         context=context
@@ -224,31 +341,67 @@ async def chat_endpoint(chat_message: ChatMessage):
             messages.append(HumanMessage(content=chat_message.message))
 
             try:
-                logger.info("Starting chat stream")
-                async for chunk in chat_model.astream(messages):
+                logger.info("Starting chat stream", extra=SAMPLED)
+                answer_parts = []
+                async for chunk in chat_model.astream(messages, config=stream_config):
                     if chunk.content:
+                        answer_parts.append(chunk.content)
                         yield f"data: {json.dumps({'content': chunk.content})}\n\n"
                         await asyncio.sleep(0)
-                logger.info("Chat stream completed")
+                logger.info("Chat stream completed", extra=SAMPLED)
+                if not url_match:
+                    answer_cache.put(
+                        chat_message.message,
+                        "".join(answer_parts),
+                        chat_message.model,
+                        corpus_version,
+                        embedding=cache_embedding
+                    )
             except Exception as e:
-                logger.error(f"Error in chat stream: {str(e)}")
+                logger.error("Error in chat stream: %s", e)
                 if not run_tree.end_time:
                     run_tree.end(error=str(e))
-                    run_tree.post()
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
         return StreamingResponse(process_stream(), media_type="text/event-stream")
         
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}")
+        logger.error("Error in chat endpoint: %s", e)
         if 'run_tree' in locals() and not run_tree.end_time:
             run_tree.end(error=str(e))
-            run_tree.post()
         raise HTTPException(status_code=500, detail=str(e))
 
+warm_up_task = None
+
+@app.on_event("startup")
+async def startup():
+    """Open the index and model clients in the background (STARTUP_MODE=lazy) or before serving (eager)"""
+    global warm_up_task
+    warm_up = document_processor.warm_up(readiness, snapshot_path=os.getenv("INDEX_SNAPSHOT_PATH"))
+    if readiness.mode == "eager":
+        await warm_up
+    else:
+        warm_up_task = asyncio.create_task(warm_up)
+    logger.info(f"Startup finished in {readiness.mode} mode")
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once every component is warmed up, 503 before"""
+    state = readiness.snapshot()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.on_event("shutdown")
+async def shutdown():
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    await ingest_jobs.shutdown()
+    await model_registry.aclose()
+    document_processor.document_loader.parallel_ingestor.shutdown()
+    tracer.shutdown()
+
 @app.get("/")
 async def read_root():
-    logger.info("Serving index.html")
+    logger.info("Serving index.html", extra=SAMPLED)
     return FileResponse('static/index.html')
 
 @app.post("/update-model")
@@ -0,0 +1,117 @@
+"""Compare HTMLCleaner against the previous multi-pass implementation.
+
+Usage: python -m scripts.benchmark_html_cleaner [page.html ...]
+
+Without arguments a large synthetic page is generated. For every page the
+script checks that both implementations produce identical text and prints
+the time per call.
+"""
+from bs4 import BeautifulSoup
+import random
+import re
+import sys
+import time
+from src.html_cleaner import HTMLCleaner
+
+
+def legacy_clean_content(html_content: str) -> str:
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for link in soup.find_all('a'):
+        if link.string:
+            link.string.replace_with(f" {link.get_text()} ")
+
+    for element in soup.find_all(['script', 'style', 'iframe']):
+        element.decompose()
+
+    doc_content = HTMLCleaner._find_main_content(soup)
+    formatted_content = []
+    current_section = None
+    section_content = []
+
+    def get_clean_text(elem):
+        for link in elem.find_all('a'):
+            if link.string:
+                link.string.replace_with(f" {link.get_text()} ")
+        text = elem.get_text()
+        text = ' '.join(text.split()).strip()
+        text = re.sub(r'^[•·⋅∙◦⦁◆►▸▹▻▷▶]', '', text).strip()
+        return text
+
+    for element in doc_content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'span', 'pre', 'code'], recursive=True):
+        if element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            if current_section and section_content:
+                formatted_content.extend(['', f'{current_section}', ''])
+                formatted_content.extend(section_content)
+                section_content = []
+            current_section = get_clean_text(element)
+        elif element.name in ['p', 'span']:
+            text = get_clean_text(element)
+            if text:
+                section_content.append(text)
+        elif element.name in ['ul', 'ol']:
+            for li in element.find_all('li', recursive=False):
+                text = get_clean_text(li)
+                if text:
+                    section_content.append(text)
+        elif element.name in ['pre', 'code']:
+            text = get_clean_text(element)
+            if text:
+                section_content.append(f"CODE: {text}")
+
+    if current_section and section_content:
+        formatted_content.extend(['', f'{current_section}', ''])
+        formatted_content.extend(section_content)
+    if not formatted_content and section_content:
+        formatted_content.extend(section_content)
+
+    seen_content = set()
+    cleaned_lines = []
+    for line in '\n'.join(formatted_content).split('\n'):
+        line = line.strip()
+        if line and line not in seen_content:
+            seen_content.add(line)
+            cleaned_lines.append(line)
+    return '\n'.join(cleaned_lines)
+
+
+def synthetic_page(sections: int = 300, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    words = "promtior genai adoption business value workflow automation consulting case study".split()
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(6, 20)))
+
+    parts = ["<html lang='en'><head><title>Synthetic</title><script>var x = 1;</script></head><body><main>"]
+    for i in range(sections):
+        parts.append(f"<h2>Section {i}</h2>")
+        parts.append(f"<p>{sentence()} <a href='/page/{i}'>link {i}</a> <span>{sentence()} <span>{sentence()}</span></span></p>")
+        items = "".join(f"<li>• {sentence()} <a href='https://linkedin.com/x{j}'>{j}</a></li>" for j in range(5))
+        parts.append(f"<ul>{items}<li><ul><li>{sentence()}</li></ul></li></ul>")
+        parts.append(f"<div><pre><code>{sentence()}</code></pre></div>")
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+
+def timed(func, html: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(paths):
+    pages = [(path, open(path, encoding="utf-8").read()) for path in paths] or [("synthetic", synthetic_page())]
+    for name, html in pages:
+        legacy = legacy_clean_content(html)
+        current = HTMLCleaner.clean_content(html)
+        equal = "identical" if legacy == current else "DIFFERENT"
+        legacy_time = timed(legacy_clean_content, html, 3)
+        current_time = timed(HTMLCleaner.clean_content, html, 3)
+        print(f"{name}: {len(html) / 1024:.0f} KiB, output {equal}")
+        print(f"  legacy   {legacy_time * 1000:8.1f} ms")
+        print(f"  current  {current_time * 1000:8.1f} ms  ({legacy_time / current_time:.1f}x, parser={HTMLCleaner.parser})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
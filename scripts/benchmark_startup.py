@@ -0,0 +1,84 @@
+"""Report import and initialization time of each startup component.
+
+Usage: python -m scripts.benchmark_startup [--runs N]
+
+Every import is measured in a fresh interpreter so modules shared between
+them are not already cached. The app is then imported and warmed up the
+way the startup hook does, and the per-component warm-up times reported by
+/ready are printed.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "langchain_core.documents",
+    "langchain_text_splitters",
+    "langchain_community.vectorstores",
+    "chromadb",
+    "langchain_openai",
+    "langchain_ollama",
+    "langsmith",
+    "aiohttp",
+    "bs4",
+    "numpy",
+    "fastapi",
+    "src.processor",
+    "main",
+]
+
+IMPORT_PROBE = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+APP_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+started = time.perf_counter()
+asyncio.run(main.document_processor.warm_up(main.readiness))
+warmed = time.perf_counter() - started
+print(json.dumps({"import": imported, "warm_up": warmed, "readiness": main.readiness.snapshot()}))
+"""
+
+
+def run_probe(code: str) -> str:
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    return result.stdout.strip().splitlines()[-1]
+
+
+def main(runs: int):
+    print(f"Cold import time, median of {runs} runs")
+    for module in MODULES:
+        try:
+            times = [float(run_probe(IMPORT_PROBE.format(module=module))) for _ in range(runs)]
+            print(f"  {module:36s} {statistics.median(times) * 1000:8.1f} ms")
+        except RuntimeError as e:
+            print(f"  {module:36s}   failed: {e}")
+
+    print("App startup (lazy construction, then warm-up)")
+    try:
+        report = json.loads(run_probe(APP_PROBE))
+    except RuntimeError as e:
+        print(f"  failed: {e}")
+        return
+    print(f"  {'import main':36s} {report['import'] * 1000:8.1f} ms")
+    print(f"  {'warm-up total':36s} {report['warm_up'] * 1000:8.1f} ms")
+    for name, state in report["readiness"]["components"].items():
+        seconds = state["seconds"]
+        timing = f"{seconds * 1000:8.1f} ms" if seconds is not None else "       -"
+        print(f"    {name:34s} {timing}  {state['status']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    main(parser.parse_args().runs)
@@ -0,0 +1,93 @@
+"""Compare search latency of the NumPy flat index and Chroma.
+
+Usage: python -m scripts.benchmark_vector_backends [--sizes 1000,100000,1000000] [--dim 768]
+                                                    [--queries 200] [--batch 4] [--k 8] [--skip-chroma]
+
+Both backends are filled with the same random unit vectors in a temporary
+directory and queried with the same batches, the way _dense_search calls
+them. Reported per size: build time, p50/p95 latency per batch, and the
+recall of Chroma's approximate HNSW results against the exact NumPy top-k.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.vector_backends import ChromaBackend, NumpyFlatIndex
+
+INSERT_BATCH = 5000
+
+
+def fill(backend, vectors: np.ndarray) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(vectors), INSERT_BATCH):
+        end = min(start + INSERT_BATCH, len(vectors))
+        ids = [f"chunk-{i}" for i in range(start, end)]
+        metadatas = [{"source": f"source-{i % 50}"} for i in range(start, end)]
+        rows = vectors[start:end]
+        # Chroma validates embeddings as plain lists
+        backend.upsert(ids, ["" for _ in ids], metadatas, rows.tolist() if isinstance(backend, ChromaBackend) else rows)
+    return time.perf_counter() - started
+
+
+def time_queries(backend, batches, k: int):
+    latencies, results = [], []
+    for batch in batches:
+        started = time.perf_counter()
+        result = backend.query(batch.tolist(), k)
+        latencies.append(time.perf_counter() - started)
+        results.extend(result["ids"])
+    return latencies, results
+
+
+def report(name: str, build: float, latencies) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"  {name:8s} build {build:8.1f} s   p50 {p50:9.2f} ms   p95 {p95:9.2f} ms")
+
+
+def main(sizes, dim: int, queries: int, batch: int, k: int, skip_chroma: bool):
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        print(f"{size} chunks, {dim} dims, {queries} queries in batches of {batch}, k={k}")
+        vectors = rng.standard_normal((size, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Queries near stored chunks, like questions about indexed content
+        picks = rng.integers(0, size, queries)
+        probes = vectors[picks] + rng.standard_normal((queries, dim), dtype=np.float32) * 0.05
+        batches = [probes[i:i + batch] for i in range(0, queries, batch)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            flat = NumpyFlatIndex(Path(tmp) / "numpy_index")
+            build = fill(flat, vectors)
+            latencies, exact = time_queries(flat, batches, k)
+            report("numpy", build, latencies)
+
+            if skip_chroma:
+                continue
+            try:
+                chroma = ChromaBackend(None, Path(tmp) / "chroma_db")
+            except ImportError as e:
+                print(f"  chroma   skipped: {e}")
+                continue
+            build = fill(chroma, vectors)
+            latencies, approximate = time_queries(chroma, batches, k)
+            report("chroma", build, latencies)
+            recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact)])
+            print(f"  chroma recall@{k} vs exact: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+    main([int(size) for size in args.sizes.split(",")], args.dim, args.queries, args.batch, args.k, args.skip_chroma)
@@ -0,0 +1,105 @@
+"""Report recall@k and memory of index compression settings against the uncompressed index.
+
+Usage: python -m scripts.compression_report [--index numpy_index] [--synthetic N --dim 768]
+                                            [--configs int8,pca:256+int8,prefix:256+int8]
+                                            [--queries 200] [--k 8] [--rescore-factor 4]
+
+By default the vectors come from the NumPy index on disk; --synthetic uses
+random low-rank vectors instead. A held-out sample of the vectors serves as
+queries. For each setting the compressor is fitted on the rest, and the
+top k from the codes alone and after full-precision re-scoring are compared
+with the exact top k.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.vector_backends import NUMPY_INDEX_DIR, NumpyFlatIndex, top_k
+from src.vector_compression import VectorCompressor
+
+DEFAULT_CONFIGS = "int8,pca:256,pca:256+int8,pca:128+int8,prefix:256+int8"
+
+
+def parse_config(config: str) -> VectorCompressor:
+    """'pca:256+int8' -> PCA to 256 dims, then int8."""
+    quantization, reduction, dimensions = "none", "none", None
+    for part in config.split("+"):
+        name, _, size = part.partition(":")
+        if name == "int8":
+            quantization = name
+        else:
+            reduction, dimensions = name, int(size)
+    return VectorCompressor(quantization, reduction, dimensions)
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # Real embeddings concentrate in far fewer directions than they have dims
+        basis = rng.standard_normal((args.dim // 8, args.dim), dtype=np.float32)
+        vectors = rng.standard_normal((args.synthetic, args.dim // 8), dtype=np.float32) @ basis
+        vectors += rng.standard_normal(vectors.shape, dtype=np.float32) * 0.5
+    else:
+        if not (Path(args.index) / "meta.json").exists():
+            raise SystemExit(f"No NumPy index at {args.index}; index with VECTOR_BACKEND=numpy or use --synthetic")
+        index = NumpyFlatIndex(args.index, compressor=VectorCompressor("none", "none"))
+        vectors = np.array(index.matrix[index.alive])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)]))
+
+
+def main(args):
+    vectors = load_vectors(args)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, found {len(vectors)}")
+    rng = np.random.default_rng(1)
+    held_out = rng.choice(len(vectors), args.queries, replace=False)
+    queries = vectors[held_out]
+    base = np.delete(vectors, held_out, axis=0)
+    k = args.k
+
+    started = time.perf_counter()
+    exact, _ = top_k(queries @ base.T, k)
+    baseline_ms = (time.perf_counter() - started) * 1000 / args.queries
+    full_mb = base.nbytes / 1024 / 1024
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {args.queries} queries, k={k}")
+    print(f"  {'setting':22s} {'scan MB':>9s} {'ratio':>7s} {'recall':>8s} {'rescored':>9s} {'ms/query':>9s}")
+    print(f"  {'float32 (exact)':22s} {full_mb:9.1f} {1.0:7.1f} {1.0:8.3f} {1.0:9.3f} {baseline_ms:9.3f}")
+
+    for config in args.configs.split(","):
+        compressor = parse_config(config)
+        sample = base[rng.choice(len(base), min(len(base), 20000), replace=False)]
+        compressor.fit(sample)
+        codes = compressor.encode(base)
+
+        started = time.perf_counter()
+        approximate = compressor.scores(queries, codes)
+        shortlist, _ = top_k(approximate, min(k * args.rescore_factor, len(base)))
+        rescored = np.einsum("qcd,qd->qc", base[shortlist], queries)
+        order, _ = top_k(rescored, k)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / args.queries
+
+        codes_mb = codes.nbytes / 1024 / 1024
+        print(
+            f"  {config:22s} {codes_mb:9.1f} {full_mb / codes_mb:7.1f} "
+            f"{recall(shortlist[:, :k], exact):8.3f} {recall(np.take_along_axis(shortlist, order, axis=1), exact):9.3f} "
+            f"{elapsed_ms:9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", default=str(NUMPY_INDEX_DIR))
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--rescore-factor", type=int, default=int(os.getenv("INDEX_RESCORE_FACTOR", "4")))
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+"""Build index snapshots for warm starts.
+
+Usage:
+    python -m scripts.index_snapshot convert OUTPUT_DIR [splits/*.json ...] [--model MODEL]
+    python -m scripts.index_snapshot export OUTPUT_DIR [--model MODEL]
+
+convert turns the JSON split backups in splits/ into a snapshot. The
+backups carry no vectors, so their chunks are embedded once here (through
+the embedding cache). export writes the current chroma_db, vectors
+included, without calling the embedding backend.
+
+Start the service with INDEX_SNAPSHOT_PATH=OUTPUT_DIR to load a snapshot
+into an empty vectorstore. The --model must match the service's model,
+since the snapshot records which embeddings produced its vectors.
+"""
+from langchain_core.documents import Document
+from pathlib import Path
+from typing import List
+import argparse
+import asyncio
+import json
+import os
+from src.processor import DocumentProcessor
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODEL = "gpt-4o" if os.getenv("ENVIRONMENT", "development") == "production" else "llama3.2"
+
+
+def load_split_backup(path: Path) -> List[Document]:
+    """Read one splits_*.json file; both backup layouts are accepted."""
+    documents = []
+    for row in json.loads(path.read_text(encoding="utf-8")):
+        metadata = dict(row.get("metadata") or {})
+        if "source" in row:
+            metadata.setdefault("source", row["source"])
+        documents.append(Document(page_content=row.get("page_content", row.get("content", "")), metadata=metadata))
+    return documents
+
+
+async def convert(output: Path, paths: List[Path], model: str) -> None:
+    documents = []
+    for path in paths:
+        backup = load_split_backup(path)
+        print(f"{path}: {len(backup)} chunks")
+        documents.extend(backup)
+
+    # Later backups are re-crawls of the same pages; keep one copy of each chunk
+    unique = list({(doc.metadata.get("source"), doc.page_content): doc for doc in documents}.values())
+    processor = DocumentProcessor(model=model)
+    count = await processor.build_snapshot(unique, output)
+    print(f"Wrote {count} chunks to {output}")
+    print(processor.retriever.embedding_pipeline.stats())
+
+
+async def export(output: Path, model: str) -> None:
+    processor = DocumentProcessor(model=model)
+    count = await processor.export_snapshot(output)
+    print(f"Exported {count} chunks to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build index snapshots for warm starts")
+    parser.add_argument("command", choices=["convert", "export"])
+    parser.add_argument("output", type=Path)
+    parser.add_argument("backups", nargs="*", type=Path)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        paths = args.backups or sorted((ROOT_DIR / "splits").glob("splits_*.json"))
+        asyncio.run(convert(args.output, paths, args.model))
+    else:
+        asyncio.run(export(args.output, args.model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import os
+import re
+import time
+from .logger import Logger
+
+logger = Logger.get_logger('answer_cache')
+
+
+def normalize_question(question: str) -> str:
+    question = " ".join(question.lower().split())
+    return question.rstrip("?!. ")
+
+
+def normalize_embedding(embedding: List[float]) -> "np.ndarray":
+    # Imported here so numpy is only loaded once an answer is cached
+    import numpy as np
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    # L2-normalized float32 array, so similarity is a plain dot product
+    embedding: Optional["np.ndarray"]
+    created_at: float
+
+
+class AnswerCache:
+    """Answers keyed by (model, corpus version, question) with exact and semantic lookup."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 similarity_threshold: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+        self.similarity_threshold = (similarity_threshold if similarity_threshold is not None
+                                     else float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")))
+        self.enabled = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+        self._entries: "OrderedDict[Tuple[str, int, str], CachedAnswer]" = OrderedDict()
+        # Keys and stacked embeddings of the entries, rebuilt after the entries change
+        self._matrix: Optional[Tuple[List[Tuple[str, int, str]], "np.ndarray"]] = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry.created_at < cutoff]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def get_exact(self, question: str, model: str, corpus_version: int) -> Optional[str]:
+        if not self.enabled:
+            return None
+        self._expire()
+        key = (model, corpus_version, normalize_question(question))
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            logger.info("Exact answer cache hit for: %s", question)
+            return entry.answer
+        return None
+
+    def get_similar(self, embedding: List[float], model: str, corpus_version: int) -> Optional[str]:
+        if not self.enabled:
+            return None
+        best_key, best_score = None, self.similarity_threshold
+        keys, matrix = self._embedding_matrix()
+        rows = [i for i, key in enumerate(keys) if key[0] == model and key[1] == corpus_version]
+        if rows:
+            # One matrix product over the candidates instead of a per-entry loop
+            scores = matrix[rows] @ normalize_embedding(embedding)
+            best = int(scores.argmax())
+            if scores[best] >= best_score:
+                best_key, best_score = keys[rows[best]], float(scores[best])
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best_key)
+        self.semantic_hits += 1
+        logger.info("Semantic answer cache hit (similarity %.3f) for: %s", best_score, best_key[2])
+        return self._entries[best_key].answer
+
+    def put(self, question: str, answer: str, model: str, corpus_version: int,
+            embedding: Optional[List[float]] = None) -> None:
+        if not self.enabled or not answer:
+            return
+        key = (model, corpus_version, normalize_question(question))
+        self._entries[key] = CachedAnswer(
+            question=question,
+            answer=answer,
+            embedding=normalize_embedding(embedding) if embedding is not None else None,
+            created_at=time.monotonic()
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def _embedding_matrix(self):
+        if self._matrix is None:
+            keys = [key for key, entry in self._entries.items() if entry.embedding is not None]
+            matrix = None
+            if keys:
+                import numpy as np
+                matrix = np.stack([self._entries[key].embedding for key in keys])
+            self._matrix = (keys, matrix)
+        return self._matrix
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+
+def replay_chunks(answer: str) -> List[str]:
+    """Split a cached answer into word-sized pieces for SSE replay."""
+    return re.findall(r"\s*\S+\s*", answer) or [answer]
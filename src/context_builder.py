@@ -0,0 +1,180 @@
+from langchain_core.documents import Document
+from typing import List, Optional, Sequence, Tuple
+import os
+import threading
+from .ingest_worker import CHUNK_OVERLAP
+from .logger import Logger, SAMPLED
+
+logger = Logger.get_logger('context_builder')
+
+SEPARATOR = "\n\n"
+MIN_OVERLAP_CHARS = 20
+# The splitter's overlap is measured in merged splits, so allow some slack
+MAX_OVERLAP_CHARS = CHUNK_OVERLAP * 2
+
+
+class TokenCounter:
+    """tiktoken counts when it is installed, otherwise about four characters per token."""
+
+    def __init__(self, encoding: Optional[str] = None):
+        self.encoding_name = encoding or os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+        self._encoding = None
+        self._loaded = False
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            try:
+                # Imported here: tiktoken comes with langchain_openai but is optional
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.info(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+            self._loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text: str, tokens: int) -> str:
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+        return text[:tokens * 4]
+
+
+def mmr_order(query_vector: Sequence[float], doc_vectors: Sequence[Sequence[float]],
+              lambda_mult: float) -> List[int]:
+    """Rank documents by maximal marginal relevance to the query.
+
+    Each step picks the document maximising
+    lambda * sim(query, doc) - (1 - lambda) * max sim(doc, already picked),
+    with all similarities taken from one pass of matrix products.
+    """
+    # Imported here so numpy is only loaded once a context is built
+    import numpy as np
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    docs = docs / np.maximum(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = docs @ query
+    similarity = docs @ docs.T
+    max_similarity = np.zeros(len(docs), dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    order = []
+    for _ in range(len(docs)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        available[pick] = False
+        np.maximum(max_similarity, similarity[pick], out=max_similarity)
+    return order
+
+
+def overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that ``right`` starts with."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into the RAG prompt context under a token budget.
+
+    Candidates are taken in MMR order when their embeddings are available,
+    so a chunk that mostly repeats one already chosen loses its slot to a
+    different one. Text a chunk shares with an adjacent chunk of the same
+    source (the splitter overlap) is cut, and chunks that would overflow
+    CONTEXT_TOKEN_BUDGET are skipped in favour of later, smaller ones.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, lambda_mult: Optional[float] = None):
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+        self.lambda_mult = lambda_mult if lambda_mult is not None else float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+        self.mmr_enabled = os.getenv("CONTEXT_MMR", "true").lower() == "true"
+        self.tokens = TokenCounter()
+        self.requests = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def build(self, documents: List[Document], k: int, query_vector: Optional[Sequence[float]] = None,
+              doc_vectors: Optional[Sequence[Sequence[float]]] = None) -> Tuple[str, dict]:
+        """Return the context for up to k of ``documents`` (best first) and a size report.
+
+        ``baseline_tokens`` is what the selected chunks would cost untrimmed,
+        so ``tokens_saved`` is what overlap trimming and budget truncation
+        removed from them. It never counts the different chunks MMR chose.
+        """
+        use_mmr = self.mmr_enabled and query_vector is not None and doc_vectors is not None and len(documents) > 1
+        order = mmr_order(query_vector, doc_vectors, self.lambda_mult) if use_mmr else range(len(documents))
+
+        separator_tokens = self.tokens.count(SEPARATOR)
+        chosen: List[Tuple[str, str]] = []
+        used = 0
+        baseline = 0
+        trimmed_chars = 0
+        for i in order:
+            if len(chosen) >= k:
+                break
+            original = documents[i].page_content.strip()
+            text, source = original, documents[i].metadata.get("source")
+            for chosen_text, chosen_source in chosen:
+                if chosen_source != source or not text:
+                    continue
+                if text in chosen_text:
+                    text = ""
+                    break
+                head = overlap_length(chosen_text, text)
+                tail = overlap_length(text, chosen_text)
+                text = text[head:len(text) - tail].strip()
+                trimmed_chars += head + tail
+            if not text:
+                continue
+
+            separator = separator_tokens if chosen else 0
+            cost = self.tokens.count(text) + separator
+            if self.token_budget and used + cost > self.token_budget:
+                if chosen:
+                    continue
+                # A single chunk larger than the whole budget is cut to fit
+                text = self.tokens.truncate(text, self.token_budget)
+                cost = self.tokens.count(text)
+            chosen.append((text, source))
+            used += cost
+            # A trimmed edge can occasionally tokenize longer; never report that as a saving
+            baseline += max(cost, self.tokens.count(original) + separator)
+
+        context = SEPARATOR.join(text for text, _ in chosen)
+        report = {
+            "chunks": len(chosen),
+            "candidates": len(documents),
+            "mmr": use_mmr,
+            "tokens": used,
+            "token_budget": self.token_budget,
+            "baseline_tokens": baseline,
+            "tokens_saved": baseline - used,
+            "overlap_chars_trimmed": trimmed_chars,
+        }
+        with self._lock:
+            self.requests += 1
+            self.tokens_used += used
+            self.tokens_saved += baseline - used
+        logger.info("Packed %d of %d chunks into %d tokens (%d saved)", len(chosen), len(documents),
+                    used, baseline - used, extra=SAMPLED)
+        return context, report
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "mmr": self.mmr_enabled,
+            "lambda": self.lambda_mult,
+            "requests": self.requests,
+            "tokens_used": self.tokens_used,
+            "tokens_saved": self.tokens_saved,
+            "avg_tokens_saved": round(self.tokens_saved / self.requests, 1) if self.requests else 0.0,
+        }
@@ -0,0 +1,170 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import sqlite3
+import threading
+import time
+import os
+from .logger import Logger
+
+logger = Logger.get_logger('crawl_cache')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = ROOT_DIR / "cache" / "crawl.db"
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    body: str
+    text: str
+    content_type: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+    metadata: Dict[str, str] = field(default_factory=dict)
+    fetched_at: float = 0.0
+    # Set by CrawlCache.get: young enough to serve without revalidating
+    fresh: bool = False
+
+
+class CrawlCache:
+    """On-disk page cache with HTTP revalidation and a total-size bound.
+
+    Entries younger than the freshness TTL are served without touching the
+    network. Older ones are revalidated with If-None-Match/If-Modified-Since
+    and a 304 reuses the stored cleaned text, so nothing is re-downloaded or
+    re-parsed.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.path = Path(path or os.getenv("CRAWL_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.max_bytes = max_bytes or int(os.getenv("CRAWL_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CRAWL_CACHE_TTL_SECONDS", "3600"))
+        self.enabled = os.getenv("CRAWL_CACHE_ENABLED", "true").lower() == "true"
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                text TEXT NOT NULL,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                links TEXT,
+                metadata TEXT,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages(last_used)")
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Look up a page; a fresh one is marked as used in the same call."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, body, text, content_type, etag, last_modified, links, metadata, fetched_at "
+                "FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            fresh = now - row[8] < self.ttl_seconds
+            if fresh:
+                self.fresh_hits += 1
+                self._conn.execute("UPDATE pages SET last_used = ? WHERE url = ?", (now, url))
+                self._conn.commit()
+        return CacheEntry(
+            url=row[0],
+            body=row[1],
+            text=row[2],
+            content_type=row[3] or "",
+            etag=row[4],
+            last_modified=row[5],
+            links=json.loads(row[6] or "[]"),
+            metadata=json.loads(row[7] or "{}"),
+            fetched_at=row[8],
+            fresh=fresh,
+        )
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def mark_revalidated(self, entry: CacheEntry) -> None:
+        """Record a 304 response: the stored copy is current again."""
+        self.revalidated += 1
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE pages SET last_used = ?, fetched_at = ? WHERE url = ?", (now, now, entry.url))
+            self._conn.commit()
+
+    def put(self, entry: CacheEntry) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        size = len(entry.body.encode("utf-8")) + len(entry.text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(url, body, text, content_type, etag, last_modified, links, metadata, fetched_at, last_used, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry.url, entry.body, entry.text, entry.content_type, entry.etag, entry.last_modified,
+                    json.dumps(entry.links), json.dumps(entry.metadata), now, now, size,
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for url, size in self._conn.execute("SELECT url, size FROM pages ORDER BY last_used ASC"):
+            if total <= self.max_bytes:
+                break
+            victims.append((url,))
+            total -= size
+        self._conn.executemany("DELETE FROM pages WHERE url = ?", victims)
+        self.evictions += len(victims)
+        logger.info("Evicted %d pages from crawl cache", len(victims))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "fresh_hits": self.fresh_hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
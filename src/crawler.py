@@ -0,0 +1,236 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+import aiohttp
+import asyncio
+import os
+from .crawl_cache import CrawlCache, CacheEntry
+from .html_cleaner import HTMLCleaner, ExtractedPage
+from .logger import Logger, SAMPLED
+
+logger = Logger.get_logger('crawler')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+DEFAULT_EXCLUDE_DIRS = ('login', 'signup', 'cart', 'checkout', 'account')
+SKIPPED_EXTENSIONS = (
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico',
+    '.css', '.js', '.zip', '.gz', '.mp4', '.mp3', '.woff', '.woff2', '.xml'
+)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Resolve, strip fragments and canonicalize scheme/host so equal pages compare equal."""
+    if base:
+        url = urljoin(base, url.strip())
+    url, _ = urldefrag(url.strip())
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    html: str
+    depth: int
+    content_type: str
+    links: List[str] = field(default_factory=list)
+    metadata: Dict[str, str] = field(default_factory=dict)
+    text: str = ""
+
+
+class SiteCrawler:
+    """Breadth-first asyncio crawler sharing one aiohttp session.
+
+    Every page is downloaded and parsed once; text, links and metadata all
+    come from that single parse.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, max_depth: int = 2,
+                 exclude_dirs: Iterable[str] = DEFAULT_EXCLUDE_DIRS,
+                 max_pages: Optional[int] = None, per_host_concurrency: Optional[int] = None,
+                 politeness_delay: Optional[float] = None, respect_robots: Optional[bool] = None,
+                 extractor: Callable[[str], ExtractedPage] = HTMLCleaner.extract, cache: Optional[CrawlCache] = None):
+        self.session = session
+        self.extractor = extractor
+        self.cache = cache
+        self.max_depth = max_depth
+        self.exclude_dirs = tuple(d.strip('/').lower() for d in exclude_dirs)
+        self.max_pages = max_pages or int(os.getenv("CRAWL_MAX_PAGES", "200"))
+        self.per_host_concurrency = per_host_concurrency or int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+        self.politeness_delay = politeness_delay if politeness_delay is not None else float(os.getenv("CRAWL_POLITENESS_DELAY", "0.1"))
+        if respect_robots is None:
+            respect_robots = os.getenv("CRAWL_RESPECT_ROBOTS", "true").lower() == "true"
+        self.respect_robots = respect_robots
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next_slot: Dict[str, float] = {}
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+
+    def _is_excluded(self, url: str) -> bool:
+        path = urlsplit(url).path.lower()
+        if path.endswith(SKIPPED_EXTENSIONS):
+            return True
+        segments = [segment for segment in path.split('/') if segment]
+        return any(segment in self.exclude_dirs for segment in segments)
+
+    async def _get_robots(self, url: str) -> Optional[RobotFileParser]:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin in self._robots:
+            return self._robots[origin]
+
+        parser = None
+        try:
+            async with self.session.get(f"{origin}/robots.txt", headers={'User-Agent': USER_AGENT}) as response:
+                if response.status < 400:
+                    parser = RobotFileParser()
+                    parser.parse((await response.text()).splitlines())
+        except Exception as e:
+            logger.info("Could not read robots.txt for %s: %s", origin, e)
+        self._robots[origin] = parser
+        return parser
+
+    async def _allowed(self, url: str) -> bool:
+        if not self.respect_robots:
+            return True
+        parser = await self._get_robots(url)
+        return parser is None or parser.can_fetch(USER_AGENT, url)
+
+    async def _wait_for_slot(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        delay = self.politeness_delay
+        parser = self._robots.get(f"{urlsplit(url).scheme}://{host}")
+        if parser is not None:
+            delay = max(delay, float(parser.crawl_delay(USER_AGENT) or 0))
+
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        loop = asyncio.get_running_loop()
+        async with lock:
+            now = loop.time()
+            slot = max(now, self._host_next_slot.get(host, now))
+            self._host_next_slot[host] = slot + delay
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def fetch(self, url: str, depth: int) -> Optional[CrawledPage]:
+        # Checked before the cache, so a page disallowed since it was cached is not served
+        if not await self._allowed(url):
+            logger.info("Skipping %s disallowed by robots.txt", url)
+            return None
+        cached = await asyncio.to_thread(self.cache.get, url) if self.cache else None
+        if cached is not None and cached.fresh:
+            return self._page_from_cache(cached, depth)
+
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        async with semaphore:
+            await self._wait_for_slot(url)
+            headers = {'User-Agent': USER_AGENT, **CrawlCache.conditional_headers(cached)}
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached is not None:
+                        await asyncio.to_thread(self.cache.mark_revalidated, cached)
+                        logger.info("Revalidated %s (304)", url, extra=SAMPLED)
+                        return self._page_from_cache(cached, depth)
+                    content_type = response.headers.get('Content-Type', '')
+                    if response.status >= 400 or 'html' not in content_type.lower():
+                        return None
+                    html = await response.text()
+                    final_url = normalize_url(str(response.url)) or url
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+            except Exception as e:
+                logger.warning("Error fetching %s: %s", url, e)
+                return None
+
+        logger.info("Fetched %s (depth %d)", url, depth, extra=SAMPLED)
+        page = self._build_page(final_url, html, depth, content_type)
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, CacheEntry(
+                url=url,
+                body=html,
+                text=page.text,
+                content_type=content_type,
+                etag=etag,
+                last_modified=last_modified,
+                links=page.links,
+                metadata=page.metadata,
+            ))
+        return page
+
+    @staticmethod
+    def _page_from_cache(entry: CacheEntry, depth: int) -> CrawledPage:
+        return CrawledPage(
+            url=entry.metadata.get("source", entry.url),
+            html=entry.body,
+            depth=depth,
+            content_type=entry.content_type,
+            links=entry.links,
+            metadata=entry.metadata,
+            text=entry.text
+        )
+
+    def _build_page(self, url: str, html: str, depth: int, content_type: str) -> CrawledPage:
+        # Text, links and metadata all come out of a single parse
+        extracted = self.extractor(html)
+        links = []
+        for href in extracted.links:
+            link = normalize_url(href, base=url)
+            if link:
+                links.append(link)
+
+        return CrawledPage(
+            url=url,
+            html=html,
+            depth=depth,
+            content_type=content_type,
+            links=list(dict.fromkeys(links)),
+            metadata={"source": url, "content_type": content_type, **extracted.metadata},
+            text=extracted.text
+        )
+
+    async def crawl(self, seed_url: str) -> List[CrawledPage]:
+        seed = normalize_url(seed_url)
+        if not seed:
+            return []
+
+        visited: Set[str] = {seed}
+        frontier = [seed]
+        pages: List[CrawledPage] = []
+
+        for depth in range(self.max_depth):
+            if not frontier:
+                break
+            results = await asyncio.gather(*(self.fetch(url, depth) for url in frontier))
+
+            next_frontier = []
+            for page in results:
+                if page is None:
+                    continue
+                pages.append(page)
+                visited.add(page.url)
+                for link in page.links:
+                    # Stay under the seed URL, like RecursiveUrlLoader(prevent_outside=True)
+                    if link in visited or not link.startswith(seed) or self._is_excluded(link):
+                        continue
+                    if len(visited) >= self.max_pages:
+                        break
+                    visited.add(link)
+                    next_frontier.append(link)
+            frontier = next_frontier
+
+        logger.info("Crawled %d pages from %s", len(pages), seed)
+        return pages
@@ -1,24 +1,25 @@
-from langchain_community.document_loaders import RecursiveUrlLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from typing import List, Dict, Tuple
+from typing import AsyncIterator, Iterable, List, Dict, Tuple
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
 from .html_cleaner import HTMLCleaner
+from .crawler import SiteCrawler, DEFAULT_EXCLUDE_DIRS
+from .crawl_cache import CrawlCache, CacheEntry
+from .ingest_worker import build_text_splitter
+from .parallel_ingest import ParallelIngestor
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
 class DocumentLoader:
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500, 
-            chunk_overlap=50, 
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""] 
-        )
+        self.text_splitter = build_text_splitter()
         self.html_cleaner = HTMLCleaner()
+        self.parallel_ingestor = ParallelIngestor()
+        self.crawl_cache = CrawlCache()
+        # Bytes of split text held before a batch is handed to indexing
+        self.split_memory_budget = int(float(os.getenv("SPLIT_MEMORY_BUDGET_MB", "2")) * 1024 * 1024)
 
     def _is_social_media(self, url: str) -> bool:
         social_domains = [
@@ -30,22 +31,10 @@ class DocumentLoader:
         ]
         return any(domain in url.lower() for domain in social_domains)
 
-    def _extract_social_links(self, html_content: str) -> List[str]:
-        """Extract social media links from HTML content."""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        social_links = []
-        
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if self._is_social_media(href):
-                social_links.append(href)
-        
-        return list(set(social_links))  # Remove duplicates
-
     def _clean_social_media_content(self, url: str, content: str) -> str:
         """Clean and structure social media content based on platform."""
         platform = self._get_platform(url)
-        soup = BeautifulSoup(content, 'html.parser')
+        soup = self.html_cleaner.parse(content)
         cleaned_content = []
 
         if platform == 'linkedin':
@@ -85,7 +74,8 @@ class DocumentLoader:
                 cleaned_content.append(f"Video Description: {description['content']}")
 
         if not cleaned_content:
-            cleaned_content = [self.html_cleaner.clean_content(content)]
+            # Reuse the parsed tree instead of parsing the page again
+            cleaned_content = [self.html_cleaner.clean_content(soup)]
 
         return "\n\n".join([
             f"Platform: {platform.title()}",
@@ -111,28 +101,51 @@ class DocumentLoader:
 
     async def fetch_url(self, url: str, session: aiohttp.ClientSession) -> str:
         try:
+            cached = await asyncio.to_thread(self.crawl_cache.get, url)
+            if cached is not None and cached.fresh:
+                return cached.text
+
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                **CrawlCache.conditional_headers(cached)
             }
             
             async with session.get(url, headers=headers, timeout=15) as response:
+                if response.status == 304 and cached is not None:
+                    await asyncio.to_thread(self.crawl_cache.mark_revalidated, cached)
+                    return cached.text
                 html = await response.text()
+                status = response.status
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                content_type = response.headers.get('Content-Type', '')
                 
                 # Enhanced social media handling
                 if self._is_social_media(url):
                     platform = self._get_platform(url)
                     if platform == 'linkedin':
-                        return await self._process_linkedin_content(url, html, session)
+                        content = await self._process_linkedin_content(url, html, session)
                     else:
-                        return self._clean_social_media_content(url, html)
+                        content = self._clean_social_media_content(url, html)
                 else:
-                    return self.html_cleaner.clean_content(html)
+                    content = self.html_cleaner.clean_content(html)
+
+            if status < 400:
+                await asyncio.to_thread(self.crawl_cache.put, CacheEntry(
+                    url=url,
+                    body=html,
+                    text=content,
+                    content_type=content_type,
+                    etag=etag,
+                    last_modified=last_modified
+                ))
+            return content
         except Exception as e:
             return ""
 
     async def _process_linkedin_content(self, url: str, html: str, session: aiohttp.ClientSession) -> str:
         """Enhanced LinkedIn content processing with deeper exploration."""
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = self.html_cleaner.parse(html)
         content_parts = []
 
         content_parts.append(f"Platform: LinkedIn\nSource: {url}\n")
@@ -163,7 +176,7 @@ class DocumentLoader:
                 try:
                     async with session.get(add_url, timeout=10) as response:
                         add_html = await response.text()
-                        add_soup = BeautifulSoup(add_html, 'html.parser')
+                        add_soup = self.html_cleaner.parse(add_html)
                         
                         main_content = add_soup.find('main')
                         if main_content:
@@ -183,31 +196,29 @@ class DocumentLoader:
             
         documents = []
         social_links = set()
-        
-        for url in urls:
-            try:
-                if not self._is_social_media(url):
-                    loader = RecursiveUrlLoader(
-                        url=url,
-                        max_depth=2, 
-                        extractor=lambda x: self.html_cleaner.clean_content(x),
-                        prevent_outside=True,  
-                        exclude_dirs=('login', 'signup', 'cart', 'checkout', 'account'),
-                    )
-                    
-                    site_docs = await asyncio.to_thread(loader.load)
-                    documents.extend(site_docs)
-                    
-                    timeout = aiohttp.ClientTimeout(total=15)
-                    async with aiohttp.ClientSession(timeout=timeout) as session:
-                        async with session.get(url) as response:
-                            html = await response.text()
-                            new_social_links = self._extract_social_links(html)
-                            social_links.update(new_social_links)
-                
-                else:
-                    timeout = aiohttp.ClientTimeout(total=15)
-                    async with aiohttp.ClientSession(timeout=timeout) as session:
+
+        # One pooled session serves the crawl, the social profiles and robots.txt
+        timeout = aiohttp.ClientTimeout(total=15)
+        conn = aiohttp.TCPConnector(limit=int(os.getenv("CRAWL_MAX_CONNECTIONS", "20")))
+        async with aiohttp.ClientSession(timeout=timeout, connector=conn) as session:
+            crawler = SiteCrawler(
+                session,
+                max_depth=2,
+                exclude_dirs=DEFAULT_EXCLUDE_DIRS,
+                extractor=self.html_cleaner.extract,
+                cache=self.crawl_cache
+            )
+
+            for url in urls:
+                try:
+                    if not self._is_social_media(url):
+                        pages = await crawler.crawl(url)
+                        for page in pages:
+                            if page.text:
+                                documents.append(Document(page_content=page.text, metadata=page.metadata))
+                            if page.depth == 0:
+                                social_links.update(link for link in page.links if self._is_social_media(link))
+                    else:
                         content = await self.fetch_url(url, session)
                         if content:
                             documents.append(Document(
@@ -217,15 +228,11 @@ class DocumentLoader:
                                     "type": "social_media"
                                 }
                             ))
-            
-            except Exception as e:
-                pass
+                
+                except Exception as e:
+                    logger.error("Error loading %s: %s", url, e)
         
-        if social_links:
-            timeout = aiohttp.ClientTimeout(total=15)
-            conn = aiohttp.TCPConnector(limit=5)
-            
-            async with aiohttp.ClientSession(timeout=timeout, connector=conn) as session:
+            if social_links:
                 tasks = [self.fetch_url(url, session) for url in social_links]
                 contents = await asyncio.gather(*tasks, return_exceptions=True)
                 
@@ -241,34 +248,62 @@ class DocumentLoader:
         
         return documents
     
-    async def load_file_documents(self, files: List[str]) -> List[Document]:
-        if not files:
-            return []
-        
-        documents = []
+    async def iter_files_splits(self, files: List[str]) -> AsyncIterator[List[Document]]:
+        """Yield the splits of several files in order, through the process pool when it is enabled."""
+        if self.parallel_ingestor.enabled:
+            async for splits in self.parallel_ingestor.iter_splits(files):
+                yield splits
+            return
         for file in files:
-            try:
-                if file.lower().endswith('.pdf'):
-                    from langchain_community.document_loaders import PyPDFLoader
-                    loader = PyPDFLoader(file)
-                    # Load PDF pages
-                    pdf_docs = loader.load()
-                    logger.info(f"Loaded {len(pdf_docs)} pages from PDF: {file}")
-                    
-                    # Process through text splitter
-                    pdf_splits = self.text_splitter.split_documents(pdf_docs)
-                    logger.info(f"Created {len(pdf_splits)} splits from PDF: {file}")
-                    
-                    documents.extend(pdf_splits)
-                else:
-                    with open(file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        documents.append(Document(page_content=content, metadata={"source": file}))
-            except Exception as e:
-                logger.error(f"Error loading file {file}: {str(e)}")
-                raise Exception(f"Error loading file {file}: {str(e)}")
-                
-        return documents
+            async for splits in self.iter_file_splits(file):
+                yield splits
+
+    async def iter_file_splits(self, file: str) -> AsyncIterator[List[Document]]:
+        """Yield the splits of a file page by page without loading it whole.
+
+        PDF pages are parsed lazily in a worker thread, so the event loop keeps
+        serving requests while a large upload is ingested.
+        """
+        if self.parallel_ingestor.enabled:
+            async for splits in self.parallel_ingestor.iter_splits([file]):
+                yield splits
+        elif file.lower().endswith('.pdf'):
+            from langchain_community.document_loaders import PyPDFLoader
+            pages = PyPDFLoader(file).lazy_load()
+            page_count = 0
+            while True:
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+                page_count += 1
+                yield self.text_splitter.split_documents([page])
+            logger.info("Streamed %s pages from PDF: %s", page_count, file)
+        else:
+            with open(file, 'r', encoding='utf-8') as f:
+                content = await asyncio.to_thread(f.read)
+            yield self.text_splitter.split_documents([Document(page_content=content, metadata={"source": file})])
+
+    async def iter_splits(self, docs: Iterable[Document]) -> AsyncIterator[List[Document]]:
+        """Split documents one at a time and yield the splits in memory-bounded batches."""
+        async def split_each():
+            for doc in docs:
+                yield await asyncio.to_thread(self.text_splitter.split_documents, [doc])
+
+        async for batch in self.batch_splits(split_each()):
+            yield batch
+
+    async def batch_splits(self, stream: AsyncIterator[List[Document]]) -> AsyncIterator[List[Document]]:
+        """Regroup a stream of splits into batches of about SPLIT_MEMORY_BUDGET_MB of text."""
+        batch, size = [], 0
+        async for splits in stream:
+            for split in splits:
+                batch.append(split)
+                size += len(split.page_content.encode('utf-8'))
+                if size >= self.split_memory_budget:
+                    yield batch
+                    batch, size = [], 0
+        if batch:
+            yield batch
 
     def _process_document_language(self, content: str, metadata: Dict) -> Tuple[str, Dict]:
         """Process document language and update metadata accordingly."""
@@ -283,15 +318,3 @@ class DocumentLoader:
             metadata['language'] = detected_lang
 
         return content, metadata
-
-    async def process_documents(self, docs: List[Document]) -> List[Document]:
-        if not docs:
-            return []
-            
-        try:
-            splits = self.text_splitter.split_documents(docs)
-            splits = splits[:50]  
-            return splits
-
-        except Exception as e:
-            raise e
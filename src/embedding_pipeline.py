@@ -0,0 +1,115 @@
+from langchain_core.embeddings import Embeddings
+from typing import List, Optional
+import asyncio
+import os
+import time
+from .logger import Logger, SAMPLED
+
+logger = Logger.get_logger('embedding_pipeline')
+
+
+class EmbeddingPipeline:
+    """Embed texts in concurrent batches whose size follows observed latency.
+
+    Up to EMBED_MAX_IN_FLIGHT batches are sent to the backend at once. A batch
+    that comes back faster than EMBED_TARGET_LATENCY_SECONDS grows the next
+    ones additively, a slow or failed batch halves them (AIMD). A failed batch
+    is retried on its own with backoff; batches that already finished are kept.
+    """
+
+    def __init__(self, embeddings: Embeddings, batch_size: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, target_latency: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", "32"))
+        self.min_batch_size = int(os.getenv("EMBED_MIN_BATCH_SIZE", "4"))
+        self.max_batch_size = int(os.getenv("EMBED_MAX_BATCH_SIZE", "256"))
+        self.batch_step = max(1, self.batch_size // 4)
+        self.max_in_flight = max_in_flight or int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+        self.target_latency = target_latency or float(os.getenv("EMBED_TARGET_LATENCY_SECONDS", "2.0"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("EMBED_MAX_RETRIES", "3"))
+        self.retry_backoff = float(os.getenv("EMBED_RETRY_BACKOFF_SECONDS", "0.5"))
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.chunks_embedded = 0
+        self.batches = 0
+        self.retries = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+
+    def _adapt(self, latency: Optional[float]) -> None:
+        if latency is not None and latency <= self.target_latency:
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.batch_step)
+        else:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Return one embedding per text, in order."""
+        if not texts:
+            return []
+
+        started = time.perf_counter()
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        position = 0
+
+        async def worker() -> None:
+            nonlocal position
+            while True:
+                async with self._semaphore:
+                    if position >= len(texts):
+                        return
+                    # Cut the batch only once a slot is free, so its size
+                    # reflects the batches that finished in the meantime
+                    start = position
+                    end = position = min(len(texts), start + self.batch_size)
+                    await self._run_batch(texts, vectors, start, end)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_in_flight)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+        return vectors
+
+    async def _run_batch(self, texts: List[str], vectors: List[Optional[List[float]]], start: int, end: int) -> None:
+        attempt = 0
+        while True:
+            batch_started = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(self.embeddings.embed_documents, texts[start:end])
+            except Exception as e:
+                self._adapt(None)
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    logger.error("Embedding batch %s-%s failed after %s attempts: %s", start, end, attempt + 1, e)
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning("Embedding batch %s-%s failed, retry %s/%s: %s", start, end, attempt, self.max_retries, e)
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                continue
+
+            latency = time.perf_counter() - batch_started
+            self._adapt(latency)
+            vectors[start:end] = result
+            self.chunks_embedded += end - start
+            self.batches += 1
+            logger.info("Embedded batch of %d in %.2fs, next batch size %d",
+                        end - start, latency, self.batch_size, extra=SAMPLED)
+            return
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "max_in_flight": self.max_in_flight,
+            "chunks_embedded": self.chunks_embedded,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failures": self.failures,
+            "chunks_per_second": round(self.chunks_embedded / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+        }
@@ -1,33 +1,78 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+import os
 import re
 
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+CONTENT_TAGS = frozenset(HEADING_TAGS + ('p', 'ul', 'ol', 'span', 'pre', 'code'))
+# Same string types Tag.get_text() collects by default
+TEXT_TYPES = (NavigableString, CData)
+BULLET_PATTERN = re.compile(r'^[•·⋅∙◦⦁◆►▸▹▻▷▶]')
+
+
+def _default_parser() -> str:
+    """html.parser unless HTML_PARSER asks for another installed backend (e.g. lxml)."""
+    parser = os.getenv("HTML_PARSER", "html.parser")
+    if parser != "html.parser":
+        try:
+            BeautifulSoup("", parser)
+        except Exception:
+            parser = "html.parser"
+    return parser
+
+
+@dataclass
+class ExtractedPage:
+    text: str
+    links: List[str] = field(default_factory=list)
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+
 class HTMLCleaner:
+    parser = _default_parser()
+
     @staticmethod
-    def clean_content(html_content: str) -> str:
+    def parse(html_content: str) -> BeautifulSoup:
+        return BeautifulSoup(html_content, HTMLCleaner.parser)
+
+    @staticmethod
+    def clean_content(html_content: Union[str, BeautifulSoup]) -> str:
         """Extract clean, relevant text content from HTML."""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        for link in soup.find_all('a'):
-            if link.string:
-                link.string.replace_with(f" {link.get_text()} ")
-        
-        for element in soup.find_all(['script', 'style', 'iframe']):
+        return HTMLCleaner.extract(html_content).text
+
+    @staticmethod
+    def extract(html_content: Union[str, BeautifulSoup]) -> ExtractedPage:
+        """Parse once and return the cleaned text together with links and page metadata."""
+        soup = html_content if isinstance(html_content, BeautifulSoup) else HTMLCleaner.parse(html_content)
+
+        anchors, removable, metadata, main_candidates = HTMLCleaner._scan(soup)
+
+        links = [link['href'] for link in anchors if link.get('href')]
+
+        for element in removable:
             element.decompose()
-        
-        doc_content = HTMLCleaner._find_main_content(soup)
+
+        # Padded after the removal pass, as the legacy text pass did: dropping
+        # an iframe or script can leave a link with a single string to pad
+        for link in anchors:
+            if not link.decomposed and link.string:
+                link.string.replace_with(f" {link.get_text()} ")
+
+        doc_content = HTMLCleaner._pick_main_content(main_candidates) or soup
         formatted_content = HTMLCleaner._process_content(doc_content)
-        
+
         seen_content = set()
         cleaned_lines = []
-        
+
         for line in formatted_content.split('\n'):
             line = line.strip()
             if line and line not in seen_content:
                 seen_content.add(line)
                 cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
-    
+
+        return ExtractedPage(text='\n'.join(cleaned_lines), links=links, metadata=metadata)
+
     @staticmethod
     def _find_main_content(soup: BeautifulSoup) -> BeautifulSoup:
         """Find the main content section of the HTML."""
@@ -39,67 +84,167 @@ class HTMLCleaner:
             soup.find('div', class_='content') or
             soup
         )
-    
+
+    @staticmethod
+    def _scan(soup: BeautifulSoup):
+        """Single pre-order pass collecting everything extract() needs from the tree.
+
+        Replaces the separate find/find_all calls (links, script/style/iframe,
+        title, meta description, <html lang>, main content candidates), each of
+        which walked the whole document again.
+        """
+        anchors = []
+        removable = []
+        metadata = {}
+        candidates = {}
+        title = description = html_tag = None
+
+        stack = [(child, False) for child in reversed(soup.contents) if isinstance(child, Tag)]
+        while stack:
+            tag, removed = stack.pop()
+            name = tag.name
+
+            if name == 'a':
+                anchors.append(tag)
+            elif name in ('script', 'style', 'iframe'):
+                if not removed:
+                    removable.append(tag)
+                removed = True
+            elif name == 'title' and title is None:
+                title = tag
+            elif name == 'meta' and description is None and tag.get('name') == 'description':
+                description = tag
+            elif name == 'html' and html_tag is None:
+                html_tag = tag
+
+            # Elements inside removed tags are gone by the time content is picked
+            if not removed:
+                key = HTMLCleaner._main_content_key(tag)
+                if key is not None and key not in candidates:
+                    candidates[key] = tag
+
+            stack.extend((child, removed) for child in reversed(tag.contents) if isinstance(child, Tag))
+
+        if title is not None and title.string:
+            metadata["title"] = title.string.strip()
+        if description is not None and description.get('content'):
+            metadata["description"] = description['content'].strip()
+        if html_tag is not None and html_tag.get('lang'):
+            metadata["language"] = html_tag['lang']
+
+        return anchors, removable, metadata, candidates
+
+    @staticmethod
+    def _main_content_key(tag: Tag) -> Optional[int]:
+        """Priority of a tag as main content, mirroring _find_main_content."""
+        if tag.name == 'div':
+            element_id = tag.get('id')
+            if element_id == 'doc-content':
+                return 0
+            if element_id == 'main-content':
+                return 1
+            if 'content' in (tag.get('class') or ()):
+                return 4
+        elif tag.name == 'article':
+            return 2
+        elif tag.name == 'main':
+            return 3
+        return None
+
+    @staticmethod
+    def _pick_main_content(candidates: Dict[int, Tag]) -> Optional[Tag]:
+        return candidates[min(candidates)] if candidates else None
+
+    @staticmethod
+    def _collect_texts(content: Tag) -> List[list]:
+        """Walk the tree once, bottom-up, and return the text of every content element.
+
+        Returns ``[name, text, li_texts]`` entries in document order, which is
+        the order ``find_all`` would yield them in. Each element's text is built
+        from its children's text instead of calling get_text() on every nested
+        match, so no subtree is walked more than once.
+        """
+        entries: List[list] = []
+        entry_for: Dict[int, list] = {}
+        # Each frame: element, iterator over its children, collected text parts
+        stack = [(content, iter(content.contents), [])]
+
+        while stack:
+            element, children, parts = stack[-1]
+            child = next(children, None)
+
+            if child is not None:
+                if isinstance(child, Tag):
+                    if child.name in CONTENT_TAGS:
+                        entry = [child.name, None, []]
+                        entries.append(entry)
+                        entry_for[id(child)] = entry
+                    stack.append((child, iter(child.contents), []))
+                elif type(child) in TEXT_TYPES:
+                    parts.append(str(child))
+                continue
+
+            stack.pop()
+            text = ''.join(parts)
+            entry = entry_for.get(id(element))
+            if entry is not None:
+                entry[1] = text
+            if stack:
+                parent, _, parent_parts = stack[-1]
+                parent_parts.append(text)
+                if element.name == 'li' and parent.name in ('ul', 'ol') and id(parent) in entry_for:
+                    entry_for[id(parent)][2].append(text)
+
+        return entries
+
     @staticmethod
     def _process_content(content: BeautifulSoup) -> str:
         """Process and format the content."""
         formatted_content = []
         current_section = None
         section_content = []
-        
-        def get_clean_text(elem):
-            # Handle links
-            for link in elem.find_all('a'):
-                if link.string:
-                    link.string.replace_with(f" {link.get_text()} ")
-            
-            # Get text and clean it
-            text = elem.get_text()
+
+        def get_clean_text(text):
             # Remove extra whitespace and normalize
             text = ' '.join(text.split()).strip()
             # Remove any remaining list markers or special characters
-            text = re.sub(r'^[•·⋅∙◦⦁◆►▸▹▻▷▶]', '', text).strip()
+            text = BULLET_PATTERN.sub('', text).strip()
             return text
-        
-        def process_element(element):
-            nonlocal current_section, section_content
-            
-            if element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+
+        # Process all elements
+        for name, raw_text, li_texts in HTMLCleaner._collect_texts(content):
+            if name in HEADING_TAGS:
                 if current_section and section_content:
                     formatted_content.extend(['', f'{current_section}', ''])
                     formatted_content.extend(section_content)
                     section_content = []
-                current_section = get_clean_text(element)
-                
-            elif element.name in ['p', 'span']:
-                text = get_clean_text(element)
+                current_section = get_clean_text(raw_text)
+
+            elif name in ['p', 'span']:
+                text = get_clean_text(raw_text)
                 if text:
                     section_content.append(text)
-                    
-            elif element.name in ['ul', 'ol']:
+
+            elif name in ['ul', 'ol']:
                 list_items = []
-                for li in element.find_all('li', recursive=False):
-                    text = get_clean_text(li)
+                for li_text in li_texts:
+                    text = get_clean_text(li_text)
                     if text:
                         list_items.append(text)  # No bullet point, just the text
                 if list_items:
                     section_content.extend(list_items)
-                    
-            elif element.name in ['pre', 'code']:
-                text = get_clean_text(element)
+
+            elif name in ['pre', 'code']:
+                text = get_clean_text(raw_text)
                 if text:
                     section_content.append(f"CODE: {text}")
-        
-        # Process all elements
-        for element in content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'span', 'pre', 'code'], recursive=True):
-            process_element(element)
-        
+
         # Add the last section
         if current_section and section_content:
             formatted_content.extend(['', f'{current_section}', ''])
             formatted_content.extend(section_content)
-        
+
         if not formatted_content and section_content:
             formatted_content.extend(section_content)
-        
-        return '\n'.join(formatted_content) 
\ No newline at end of file
+
+        return '\n'.join(formatted_content)
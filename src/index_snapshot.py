@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import json
+import os
+import shutil
+import time
+import numpy as np
+from .logger import Logger
+
+logger = Logger.get_logger('index_snapshot')
+
+SNAPSHOT_FORMAT = "promtior-index-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.jsonl"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+
+@dataclass
+class SnapshotBatch:
+    ids: List[str]
+    texts: List[str]
+    metadatas: List[dict]
+    embeddings: np.ndarray
+
+
+class SnapshotWriter:
+    """Write a snapshot directory batch by batch.
+
+    Layout: manifest.json (format, version, fingerprint, count),
+    chunks.jsonl (id, text, metadata per row) and embeddings.npy, a float32
+    (count, dimension) matrix row-aligned with chunks.jsonl. Everything is
+    written into a temporary directory that replaces the target at the end.
+    """
+
+    def __init__(self, path: Path, model: str):
+        self.path = Path(path)
+        self.model = model
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        if self.tmp_path.exists():
+            shutil.rmtree(self.tmp_path)
+        self.tmp_path.mkdir(parents=True)
+        self._chunks = open(self.tmp_path / CHUNKS_FILE, "w", encoding="utf-8")
+        self._vectors = open(self.tmp_path / "embeddings.f32", "wb")
+        self.count = 0
+        self.dimension: Optional[int] = None
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict], embeddings) -> None:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got shape {matrix.shape}")
+        if self.dimension is None:
+            self.dimension = matrix.shape[1]
+        elif matrix.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension changed from {self.dimension} to {matrix.shape[1]}")
+
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            self._chunks.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}) + "\n")
+        self._vectors.write(matrix.tobytes())
+        self.count += len(ids)
+
+    def close(self) -> Path:
+        self._chunks.close()
+        self._vectors.close()
+        dimension = self.dimension or 0
+
+        # Wrap the raw rows in an .npy header so readers can memory-map them
+        raw_path = self.tmp_path / "embeddings.f32"
+        matrix = np.lib.format.open_memmap(
+            self.tmp_path / EMBEDDINGS_FILE, mode="w+", dtype=np.float32, shape=(self.count, dimension)
+        )
+        if self.count:
+            matrix[:] = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(self.count, dimension))
+        matrix.flush()
+        del matrix
+        raw_path.unlink()
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "fingerprint": {"model": self.model, "dimension": dimension},
+            "count": self.count,
+            "created_at": time.time(),
+        }
+        (self.tmp_path / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+        logger.info(f"Wrote snapshot of {self.count} chunks ({dimension} dims) to {self.path}")
+        return self.path
+
+
+class IndexSnapshot:
+    """Read side of a snapshot; embeddings are memory-mapped, not loaded."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        manifest = json.loads((self.path / MANIFEST_FILE).read_text(encoding="utf-8"))
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{self.path} is not an index snapshot")
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {manifest.get('version')}")
+        self.fingerprint = manifest["fingerprint"]
+        self.count = manifest["count"]
+        self.embeddings = np.load(self.path / EMBEDDINGS_FILE, mmap_mode="r")
+        if self.embeddings.shape != (self.count, self.fingerprint["dimension"]):
+            raise ValueError(f"Snapshot matrix shape {self.embeddings.shape} does not match its manifest")
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[SnapshotBatch]:
+        with open(self.path / CHUNKS_FILE, "r", encoding="utf-8") as f:
+            start = 0
+            batch: List[Tuple[str, str, dict]] = []
+            for line in f:
+                row = json.loads(line)
+                batch.append((row["id"], row["text"], row["metadata"]))
+                if len(batch) >= batch_size:
+                    yield self._batch(batch, start)
+                    start += len(batch)
+                    batch = []
+            if batch:
+                yield self._batch(batch, start)
+
+    def _batch(self, rows: List[Tuple[str, str, dict]], start: int) -> SnapshotBatch:
+        return SnapshotBatch(
+            ids=[row[0] for row in rows],
+            texts=[row[1] for row in rows],
+            metadatas=[row[2] for row in rows],
+            embeddings=self.embeddings[start:start + len(rows)],
+        )
@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import asyncio
+import os
+import time
+import uuid
+from .logger import Logger
+
+logger = Logger.get_logger('ingest_jobs')
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+
+@dataclass
+class IngestJob:
+    id: str
+    key: str
+    kind: str
+    sources: List[str]
+    # Source recorded on a file job's chunks when it differs from the path parsed
+    source_name: Optional[str] = None
+    status: str = QUEUED
+    stage: str = QUEUED
+    chunks_done: int = 0
+    errors: List[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "sources": self.sources,
+            "status": self.status,
+            "stage": self.stage,
+            "chunks_done": self.chunks_done,
+            "errors": self.errors,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestJobManager:
+    """Run ingestion in a bounded pool of background workers.
+
+    Submitting returns a job immediately. Identical jobs that are still
+    queued or running are deduplicated onto the existing job, and ingestion
+    concurrency is capped by INGEST_JOB_WORKERS independently of chat load.
+    """
+
+    def __init__(self, processor, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.processor = processor
+        self.workers = workers or int(os.getenv("INGEST_JOB_WORKERS", "2"))
+        self.max_queue = max_queue or int(os.getenv("INGEST_JOB_QUEUE_SIZE", "100"))
+        self.retention = int(os.getenv("INGEST_JOB_RETENTION", "200"))
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._in_flight: Dict[str, IngestJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker_tasks = [
+                asyncio.create_task(self._worker(i), name=f"ingest-worker-{i}")
+                for i in range(self.workers)
+            ]
+            logger.info(f"Started {self.workers} ingestion workers")
+
+    def submit(self, kind: str, sources: List[str], key: Optional[str] = None,
+               source_name: Optional[str] = None) -> IngestJob:
+        """Queue an ingestion job, or return the in-flight job doing the same work."""
+        self._ensure_workers()
+        key = key or f"{kind}:" + "\n".join(sorted(sources))
+        existing = self._in_flight.get(key)
+        if existing is not None:
+            logger.info("Deduplicated ingestion of %s onto job %s", sources, existing.id)
+            return existing
+
+        job = IngestJob(id=uuid.uuid4().hex, key=key, kind=kind, sources=list(sources), source_name=source_name)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise RuntimeError("Ingestion queue is full, try again later")
+
+        self.jobs[job.id] = job
+        self._in_flight[key] = job
+        self._prune()
+        logger.info("Queued %s ingestion job %s for %s", kind, job.id, sources)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued: the worker skips it when it gets there
+            self._finish(job, CANCELLED)
+        return job
+
+    async def wait(self, job: IngestJob, timeout: Optional[float] = None) -> bool:
+        """Wait for a job to finish; True if it did within the timeout."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _finish(self, job: IngestJob, status: str) -> None:
+        job.status = status
+        job.stage = status
+        job.finished_at = time.time()
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+        job.done.set()
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == QUEUED:
+                    job.task = asyncio.create_task(self._run(job))
+                    try:
+                        await job.task
+                    except asyncio.CancelledError:
+                        if not job.task.cancelled():
+                            raise
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestJob) -> None:
+        def progress(stage: str, chunks_done: int) -> None:
+            job.stage = stage
+            job.chunks_done = chunks_done
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        logger.info("Running ingestion job %s", job.id)
+        try:
+            if job.kind == "file":
+                job.chunks_done = await self.processor.ingest_file_stream(
+                    job.sources[0], progress=progress, source=job.source_name
+                )
+            else:
+                job.chunks_done = await self.processor.ingest_sources(job.sources, progress=progress)
+            self._finish(job, COMPLETED)
+            logger.info("Ingestion job %s completed with %s chunks", job.id, job.chunks_done)
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+            logger.info("Ingestion job %s cancelled", job.id)
+            raise
+        except Exception as e:
+            job.errors.append(str(e))
+            self._finish(job, FAILED)
+            logger.error("Ingestion job %s failed: %s", job.id, e)
+
+    def stats(self) -> dict:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight": len(self._in_flight),
+            "jobs": counts,
+        }
+
+    async def shutdown(self) -> None:
+        for job in list(self._in_flight.values()):
+            self.cancel(job.id)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
@@ -0,0 +1,171 @@
+from langchain_core.documents import Document
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import hashlib
+import json
+import os
+from .embedding_cache import normalize_text
+from .ingest_worker import CHUNK_OVERLAP, CHUNK_SIZE
+from .logger import Logger
+
+logger = Logger.get_logger('ingest_manifest')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MANIFEST_PATH = ROOT_DIR / "chroma_db" / "ingest_manifest.json"
+# Part of every source hash, so changing the splitter re-splits unchanged sources
+SPLIT_SETTINGS = f"{CHUNK_SIZE}:{CHUNK_OVERLAP}".encode("utf-8")
+
+
+def assign_chunk_ids(documents: List[Document]) -> List[str]:
+    """The IDs streamed ingestion would give these chunks, without consulting a manifest."""
+    occurrences: Dict[str, int] = {}
+    ids = []
+    for doc in documents:
+        digest = IngestManifest.chunk_digest(str(doc.metadata.get("source", "unknown")), doc.page_content)
+        occurrence = occurrences.get(digest, 0)
+        occurrences[digest] = occurrence + 1
+        ids.append(f"{digest}-{occurrence}")
+    return ids
+
+
+class IngestManifest:
+    """Persistent map of source -> content hash -> chunk IDs in the vectorstore.
+
+    The content hash is taken over the raw file bytes or page texts before
+    parsing, so a source whose hash matches is skipped without being split.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or os.getenv("INGEST_MANIFEST_PATH", DEFAULT_MANIFEST_PATH))
+        self.sources: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                self.sources = json.loads(self.path.read_text(encoding="utf-8"))
+                logger.info(f"Loaded ingest manifest with {len(self.sources)} sources")
+            except Exception as e:
+                logger.warning(f"Could not read ingest manifest, starting empty: {str(e)}")
+
+    @staticmethod
+    def chunk_digest(source: str, content: str) -> str:
+        return hashlib.sha256(f"{source}\0{normalize_text(content)}".encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        digest = hashlib.sha256(SPLIT_SETTINGS)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def text_hash(texts: Iterable[str]) -> str:
+        digest = hashlib.sha256(SPLIT_SETTINGS)
+        for text in texts:
+            digest.update(b"\0" + text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def unchanged(self, source: str, content_hash: str) -> bool:
+        """Whether the source was last ingested completely from the same content."""
+        return self.sources.get(source, {}).get("hash") == content_hash
+
+    def stream(self, source: str, content_hash: Optional[str] = None) -> "SourceIngest":
+        """Start an incremental ingest of one source whose chunks arrive in batches."""
+        return SourceIngest(self, source, content_hash)
+
+    def record_chunks(self, source: str, chunk_ids: List[str], content_hash: Optional[str] = None) -> None:
+        """Mark chunks as present for a source; without a content hash the next ingest parses it again."""
+        self.sources[source] = {"hash": content_hash, "chunks": chunk_ids}
+
+    def commit_streams(self, ingests: List["SourceIngest"]) -> None:
+        """Record several streamed sources and write the manifest once."""
+        if not ingests:
+            return
+        for ingest in ingests:
+            ingest.record()
+        self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.sources), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+class SourceIngest:
+    """Chunk IDs for one source assigned batch by batch.
+
+    Only the IDs are kept, so a source can be streamed through in bounded
+    memory; chunks already present in the vectorstore are filtered out of
+    every batch before embedding.
+    """
+
+    def __init__(self, manifest: IngestManifest, source: str, content_hash: Optional[str] = None):
+        self.manifest = manifest
+        self.source = source
+        self.content_hash = content_hash
+        self.known = set(manifest.sources.get(source, {}).get("chunks", []))
+        self.ids: List[str] = []
+        self._occurrences: Dict[str, int] = {}
+
+    def add(self, documents: List[Document]):
+        """Assign IDs to the next batch; return only the chunks not indexed yet."""
+        new_documents, new_ids = [], []
+        for doc in documents:
+            # Repeated chunks within a source get an occurrence suffix
+            digest = self.manifest.chunk_digest(self.source, doc.page_content)
+            occurrence = self._occurrences.get(digest, 0)
+            self._occurrences[digest] = occurrence + 1
+            chunk_id = f"{digest}-{occurrence}"
+            self.ids.append(chunk_id)
+            if chunk_id not in self.known:
+                new_documents.append(doc)
+                new_ids.append(chunk_id)
+        return new_documents, new_ids
+
+    def discard(self, chunk_ids: List[str]) -> None:
+        """Leave chunks out of the record, so the next ingest of the source checks them again."""
+        dropped = set(chunk_ids)
+        self.ids = [chunk_id for chunk_id in self.ids if chunk_id not in dropped]
+        # An unchanged source is otherwise skipped before these are reached
+        self.content_hash = None
+
+    def stale_ids(self) -> List[str]:
+        return sorted(self.known - set(self.ids))
+
+    def record(self) -> None:
+        self.manifest.record_chunks(self.source, self.ids, self.content_hash)
+
+
+class SourceLocks:
+    """Per-source locks, so two ingests of one source never diff against the same manifest state."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._holders: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, sources: Iterable[str]):
+        # Always taken in sorted order, so ingests sharing several sources cannot deadlock
+        keys = sorted(set(sources))
+        for key in keys:
+            self._locks.setdefault(key, asyncio.Lock())
+            self._holders[key] = self._holders.get(key, 0) + 1
+        busy = [key for key in keys if self._locks[key].locked()]
+        if busy:
+            logger.info("Waiting for another ingest of %d sources to finish", len(busy))
+        acquired = []
+        try:
+            for key in keys:
+                await self._locks[key].acquire()
+                acquired.append(key)
+            yield
+        finally:
+            for key in acquired:
+                self._locks[key].release()
+            for key in keys:
+                self._holders[key] -= 1
+                if not self._holders[key]:
+                    del self._holders[key]
+                    del self._locks[key]
@@ -0,0 +1,56 @@
+"""Parse/split work that runs inside ingestion worker processes.
+
+Kept free of the app's logging and client setup so that spawned workers
+only import what they need to parse and split files.
+"""
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from typing import List, NamedTuple, Optional
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+_splitter = None
+
+
+def build_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=SEPARATORS
+    )
+
+
+class ParseTask(NamedTuple):
+    path: str
+    start_page: int = 0
+    end_page: Optional[int] = None
+
+
+def count_pdf_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def parse_and_split(task: ParseTask) -> List[Document]:
+    """Parse one file, or one page range of a PDF, and return its splits."""
+    global _splitter
+    if _splitter is None:
+        _splitter = build_text_splitter()
+
+    if task.path.lower().endswith('.pdf'):
+        from pypdf import PdfReader
+        reader = PdfReader(task.path)
+        end_page = len(reader.pages) if task.end_page is None else task.end_page
+        # Same text and metadata PyPDFLoader produces per page
+        docs = [
+            Document(page_content=reader.pages[i].extract_text(), metadata={"source": task.path, "page": i})
+            for i in range(task.start_page, end_page)
+        ]
+    else:
+        with open(task.path, 'r', encoding='utf-8') as f:
+            docs = [Document(page_content=f.read(), metadata={"source": task.path})]
+
+    return _splitter.split_documents(docs)
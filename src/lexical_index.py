@@ -0,0 +1,116 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from .logger import Logger, SAMPLED
+
+logger = Logger.get_logger('lexical_index')
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with accents folded, so 'Promtior' matches 'promtior' and 'tecnología' 'tecnologia'."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return TOKEN_PATTERN.findall(folded)
+
+
+class BM25Index:
+    """In-memory inverted index over the stored chunks, scored with Okapi BM25.
+
+    Chunks are added and removed by vectorstore ID as they are indexed or
+    deleted, so the index always mirrors the collection without a rebuild.
+    """
+
+    def __init__(self, k1: Optional[float] = None, b: Optional[float] = None):
+        self.k1 = k1 if k1 is not None else float(os.getenv("BM25_K1", "1.5"))
+        self.b = b if b is not None else float(os.getenv("BM25_B", "0.75"))
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Tuple[str, dict]] = {}
+        self.total_length = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                if chunk_id in self.doc_lengths:
+                    self._remove(chunk_id)
+                counts = Counter(tokenize(text))
+                for term, count in counts.items():
+                    self.postings.setdefault(term, {})[chunk_id] = count
+                length = sum(counts.values())
+                self.doc_lengths[chunk_id] = length
+                self.total_length += length
+                self.documents[chunk_id] = (text, metadata or {})
+
+    def remove(self, ids: List[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self.doc_lengths:
+                    self._remove(chunk_id)
+
+    def _remove(self, chunk_id: str) -> None:
+        text, _ = self.documents.pop(chunk_id)
+        self.total_length -= self.doc_lengths.pop(chunk_id)
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.documents.clear()
+            self.total_length = 0
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return up to k (chunk id, score) pairs, best first."""
+        started = time.perf_counter()
+        with self._lock:
+            total_docs = len(self.doc_lengths)
+            if not total_docs:
+                return []
+            avg_length = self.total_length / total_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+        elapsed = time.perf_counter() - started
+        self.searches += 1
+        self.search_seconds += elapsed
+        logger.info("BM25 search for %r matched %d chunks in %.3fms", query, len(scores), elapsed * 1000, extra=SAMPLED)
+        return top
+
+    def get(self, chunk_id: str) -> Tuple[str, dict]:
+        return self.documents[chunk_id]
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.doc_lengths),
+            "terms": len(self.postings),
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_seconds / self.searches * 1000, 4) if self.searches else 0.0,
+        }
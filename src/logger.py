@@ -1,9 +1,53 @@
 import logging
 import sys
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import atexit
+import queue
+import random
 import os
 
+# Pass as ``extra=SAMPLED`` on high-volume hot-path lines so they can be
+# thinned out with LOG_SAMPLE_RATE instead of being written every time.
+SAMPLED = {"sampled": True}
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records marked as sampled."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+# Arguments of these types cannot change between logging and formatting
+IMMUTABLE_ARGS = (str, int, float, bytes, type(None))
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records unformatted; the listener thread does the formatting.
+
+    The stock QueueHandler merges msg and args on the calling thread so the
+    record can be pickled. The queue here never leaves the process, so that
+    work is deferred to the listener along with all handler I/O. Records
+    with arguments other than strings and numbers are still formatted here,
+    since the caller could mutate them before the listener gets to them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        # A mapping passed for %(name)s formatting is itself mutable
+        if args and (isinstance(args, dict) or not all(isinstance(arg, IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
 class Logger:
     _instance = None
     _initialized = False
@@ -16,6 +60,7 @@ class Logger:
     def __init__(self):
         if not Logger._initialized:
             Logger._initialized = True
+            self.listener = None
             self.setup_logging()
 
     def setup_logging(self):
@@ -23,6 +68,10 @@ class Logger:
         log_dir = Path("logs")
         log_dir.mkdir(exist_ok=True)
 
+        # "queue" runs all handlers on a listener thread, "sync" writes inline
+        mode = os.getenv("LOG_MODE", "queue").lower()
+        sampling_filter = SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1.0")))
+
         # Configure root logger
         root_logger = logging.getLogger()
         root_logger.setLevel(logging.INFO)
@@ -34,14 +83,20 @@ class Logger:
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
         console_handler.setFormatter(console_format)
-        root_logger.addHandler(console_handler)
 
         # Component loggers setup
         components = [
             'main', 'processor', 'document_loader', 'query_analyzer',
-            'retriever', 'source_processor', 'html_cleaner'
+            'retriever', 'source_processor', 'html_cleaner',
+            'embedding_cache', 'answer_cache', 'model_registry',
+            'tracing', 'crawler', 'crawl_cache',
+            'ingest_manifest', 'parallel_ingest', 'ingest_jobs', 'embedding_pipeline',
+            'index_snapshot', 'startup', 'lexical_index',
+            'retrieval_cache', 'vector_backends', 'vector_compression',
+            'near_duplicates', 'context_builder'
         ]
 
+        file_handlers = []
         for component in components:
             logger = logging.getLogger(component)
             logger.setLevel(logging.INFO)
@@ -57,7 +112,27 @@ class Logger:
                 '%(asctime)s - %(levelname)s - %(message)s'
             )
             file_handler.setFormatter(file_format)
-            logger.addHandler(file_handler)
+            # Only this component's records reach its file, in either mode
+            file_handler.addFilter(logging.Filter(component))
+            file_handlers.append(file_handler)
+
+        if mode == "queue":
+            log_queue = queue.SimpleQueue()
+            queue_handler = LazyQueueHandler(log_queue)
+            queue_handler.addFilter(sampling_filter)
+            root_logger.addHandler(queue_handler)
+
+            self.listener = QueueListener(
+                log_queue, console_handler, *file_handlers, respect_handler_level=True
+            )
+            self.listener.start()
+            atexit.register(self.listener.stop)
+        else:
+            console_handler.addFilter(sampling_filter)
+            root_logger.addHandler(console_handler)
+            for component, file_handler in zip(components, file_handlers):
+                file_handler.addFilter(sampling_filter)
+                logging.getLogger(component).addHandler(file_handler)
 
     @staticmethod
     def get_logger(name: str) -> logging.Logger:
@@ -65,4 +140,4 @@ class Logger:
         return logging.getLogger(name)
 
 # Initialize logger on module import
-logger_instance = Logger() 
\ No newline at end of file
+logger_instance = Logger()
@@ -0,0 +1,184 @@
+from langchain_core.embeddings import Embeddings
+from typing import Dict, List, Optional
+import threading
+import httpx
+import os
+from .logger import Logger
+
+logger = Logger.get_logger('model_registry')
+
+OPENAI_MODELS = ["gpt-4o", "gpt-4o-mini"]
+# Same as the langchain_openai default, set explicitly so the cache key is known up front
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+
+
+class ModelRegistry:
+    """Process-wide registry that builds each model client once and shares its HTTP pool."""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ModelRegistry, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._lock = threading.Lock()
+        self._chat_models: Dict[str, object] = {}
+        self._embeddings: Dict[str, object] = {}
+        self._requests: Dict[str, int] = {}
+        self._limits = httpx.Limits(
+            max_connections=int(os.getenv("MODEL_POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("MODEL_POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("MODEL_POOL_KEEPALIVE_SECONDS", "60")),
+        )
+        self._timeout = httpx.Timeout(float(os.getenv("MODEL_HTTP_TIMEOUT_SECONDS", "120")))
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    @staticmethod
+    def is_openai_model(model: str) -> bool:
+        return model in OPENAI_MODELS
+
+    def _openai_http_clients(self):
+        # OpenAI chat and embedding clients all share one sync and one async pool
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits, timeout=self._timeout)
+            self._http_async_client = httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+            logger.info("Created shared OpenAI HTTP connection pools")
+        return self._http_client, self._http_async_client
+
+    def _ollama_client_kwargs(self) -> dict:
+        return {"limits": self._limits, "timeout": self._timeout}
+
+    def get_chat_model(self, model: str):
+        """Return the shared chat client for a model, creating it on first use.
+
+        Per-request callbacks are passed at call time through
+        ``config={"callbacks": [...]}`` so the client never has to be rebuilt.
+        """
+        with self._lock:
+            self._requests[model] = self._requests.get(model, 0) + 1
+            chat_model = self._chat_models.get(model)
+            if chat_model is not None:
+                return chat_model
+
+            # Provider packages are imported on first use to keep startup fast
+            if self.is_openai_model(model):
+                from langchain_openai import ChatOpenAI
+                http_client, http_async_client = self._openai_http_clients()
+                chat_model = ChatOpenAI(
+                    model=model,
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    streaming=True,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+                logger.info(f"OpenAI chat model {model} registered")
+            else:
+                from langchain_ollama import ChatOllama
+                chat_model = ChatOllama(
+                    model=model,
+                    base_url=os.getenv("OLLAMA_BASE_URL"),
+                    client_kwargs=self._ollama_client_kwargs(),
+                )
+                logger.info(f"Ollama chat model {model} registered")
+
+            self._chat_models[model] = chat_model
+            return chat_model
+
+    def get_embeddings(self, model: str):
+        """Return the shared embedding client used with a chat model."""
+        with self._lock:
+            embeddings = self._embeddings.get(model)
+            if embeddings is not None:
+                return embeddings
+
+            if self.is_openai_model(model):
+                from langchain_openai import OpenAIEmbeddings
+                http_client, http_async_client = self._openai_http_clients()
+                embeddings = OpenAIEmbeddings(
+                    model=OPENAI_EMBEDDING_MODEL,
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+                logger.info("OpenAI embeddings registered")
+            else:
+                from langchain_ollama import OllamaEmbeddings
+                embeddings = OllamaEmbeddings(
+                    model=model,
+                    base_url=os.getenv("OLLAMA_BASE_URL"),
+                    client_kwargs=self._ollama_client_kwargs(),
+                )
+                logger.info(f"Ollama embeddings registered for {model}")
+
+            self._embeddings[model] = embeddings
+            return embeddings
+
+    def get_lazy_embeddings(self, model: str) -> "LazyEmbeddings":
+        """Embeddings that only build the client when something is first embedded."""
+        return LazyEmbeddings(self, model)
+
+    def embedding_model_key(self, model: str) -> str:
+        """Identify the vector space of a chat model's embeddings without building them."""
+        if self.is_openai_model(model):
+            return f"openai:{OPENAI_EMBEDDING_MODEL}"
+        return f"ollama:{model}"
+
+    @staticmethod
+    def _pool_connections(client) -> Optional[int]:
+        # httpx does not expose pool state publicly; read it best-effort
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chat_models": sorted(self._chat_models),
+                "embedding_models": sorted(self._embeddings),
+                "requests_per_model": dict(self._requests),
+                "pool_limits": {
+                    "max_connections": self._limits.max_connections,
+                    "max_keepalive_connections": self._limits.max_keepalive_connections,
+                    "keepalive_expiry": self._limits.keepalive_expiry,
+                },
+                "openai_pool": {
+                    "sync_connections": self._pool_connections(self._http_client),
+                    "async_connections": self._pool_connections(self._http_async_client),
+                },
+            }
+
+    async def aclose(self) -> None:
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+        self._http_client = None
+        self._http_async_client = None
+        self._chat_models.clear()
+        self._embeddings.clear()
+        logger.info("Model registry closed")
+
+
+class LazyEmbeddings(Embeddings):
+    def __init__(self, registry: ModelRegistry, model: str):
+        self.registry = registry
+        self.model = model
+
+    @property
+    def backend(self) -> Embeddings:
+        return self.registry.get_embeddings(self.model)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.backend.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.backend.embed_query(text)
+
+
+model_registry = ModelRegistry()
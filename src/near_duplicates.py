@@ -0,0 +1,133 @@
+from typing import Collection, Dict, List, Optional, Set, Tuple
+import hashlib
+import os
+import threading
+import numpy as np
+from .lexical_index import tokenize
+from .logger import Logger
+
+logger = Logger.get_logger('near_duplicates')
+
+SHINGLE_SIZE = 3
+MINHASH_PRIME = (1 << 61) - 1
+MINHASH_SEED = 1
+
+
+class NearDuplicateIndex:
+    """MinHash signatures of stored chunks, banded into an LSH table.
+
+    A chunk's signature is the minimum of each of N hash permutations over
+    its three-word shingles, so two signatures agree in about the fraction
+    of positions equal to the Jaccard similarity of the chunks. Chunks
+    sharing any band of rows are candidates, and a candidate counts as a
+    duplicate when its estimated similarity reaches NEAR_DUPLICATE_THRESHOLD.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, permutations: Optional[int] = None,
+                 bands: Optional[int] = None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+        self.permutations = permutations or int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+        self.bands = bands or int(os.getenv("MINHASH_BANDS", "16"))
+        if self.permutations % self.bands:
+            raise ValueError(f"MINHASH_PERMUTATIONS ({self.permutations}) must be a multiple of MINHASH_BANDS ({self.bands})")
+        self.rows = self.permutations // self.bands
+        # a * h + b stays below 2**64 for 32-bit shingle hashes
+        rng = np.random.default_rng(MINHASH_SEED)
+        self._a = rng.integers(1, 1 << 32, self.permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, self.permutations, dtype=np.uint64)
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: Dict[Tuple[int, int], Set[str]] = {}
+        self.checked = 0
+        self.dropped = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        return ((np.outer(hashes, self._a) + self._b) % MINHASH_PRIME).min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        return [(band, hash(signature[band * self.rows:(band + 1) * self.rows].tobytes())) for band in range(self.bands)]
+
+    def _insert(self, chunk_id: str, signature: np.ndarray) -> None:
+        self.signatures[chunk_id] = signature
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, set()).add(chunk_id)
+
+    def _match(self, signature: np.ndarray, exclude: Collection[str]) -> Optional[str]:
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for chunk_id in candidates:
+            if chunk_id in exclude:
+                continue
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        return best
+
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        """Register chunks that are already stored, without checking them."""
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id not in self.signatures:
+                    signature = self.signature(text)
+                    if signature is not None:
+                        self._insert(chunk_id, signature)
+
+    def filter(self, ids: List[str], texts: List[str],
+               exclude: Collection[str] = frozenset()) -> Tuple[List[int], Dict[str, str]]:
+        """Split new chunks into the positions to keep and dropped ID -> ID of the chunk it repeats.
+
+        Kept chunks are registered right away so later chunks of the same
+        ingest are compared against them too. Chunks in ``exclude`` are
+        never matched, e.g. the previous version of the source being
+        re-indexed, which is about to be deleted.
+        """
+        keep, duplicates = [], {}
+        with self._lock:
+            for position, (chunk_id, text) in enumerate(zip(ids, texts)):
+                self.checked += 1
+                signature = self.signature(text)
+                match = self._match(signature, exclude) if signature is not None else None
+                if match is not None:
+                    duplicates[chunk_id] = match
+                    self.dropped += 1
+                    continue
+                keep.append(position)
+                if signature is not None:
+                    self._insert(chunk_id, signature)
+        return keep, duplicates
+
+    def remove(self, ids: List[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                signature = self.signatures.pop(chunk_id, None)
+                if signature is None:
+                    continue
+                for key in self._band_keys(signature):
+                    bucket = self.buckets.get(key)
+                    if bucket is not None:
+                        bucket.discard(chunk_id)
+                        if not bucket:
+                            del self.buckets[key]
+
+    def stats(self) -> dict:
+        return {
+            "chunks": len(self.signatures),
+            "threshold": self.threshold,
+            "permutations": self.permutations,
+            "bands": self.bands,
+            "checked": self.checked,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,78 @@
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document
+from typing import AsyncIterator, List, Optional
+import asyncio
+import multiprocessing
+import os
+from .ingest_worker import ParseTask, count_pdf_pages, parse_and_split
+from .logger import Logger
+
+logger = Logger.get_logger('parallel_ingest')
+
+
+class ParallelIngestor:
+    """Fan file parsing and splitting out to a process pool.
+
+    Files are split into tasks (whole files, or page ranges for large PDFs)
+    and results are collected in submission order, so the output is the same
+    regardless of which worker finishes first.
+    """
+
+    def __init__(self, workers: Optional[int] = None, pages_per_task: Optional[int] = None):
+        self.workers = workers or int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+        self.pages_per_task = pages_per_task or int(os.getenv("INGEST_PAGES_PER_TASK", "25"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 1
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps the app's logging and exporter threads out of the workers
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Started ingestion process pool with {self.workers} workers")
+        return self._executor
+
+    def plan(self, files: List[str]) -> List[ParseTask]:
+        tasks = []
+        for path in files:
+            if path.lower().endswith('.pdf'):
+                pages = count_pdf_pages(path)
+                for start in range(0, pages, self.pages_per_task):
+                    tasks.append(ParseTask(path, start, min(start + self.pages_per_task, pages)))
+            else:
+                tasks.append(ParseTask(path))
+        return tasks
+
+    async def iter_splits(self, files: List[str]) -> AsyncIterator[List[Document]]:
+        """Yield the splits of all files range by range, in order, with a bounded number of ranges in flight.
+
+        Every file goes into one submission window, so a batch of small files
+        is spread across the workers instead of being parsed one at a time.
+        """
+        tasks = await asyncio.to_thread(self.plan, files)
+        logger.info("Parsing %d files as %d tasks on %s workers", len(files), len(tasks), self.workers)
+        loop = asyncio.get_running_loop()
+        window = self.workers * 2
+        in_flight = []
+        try:
+            for task in tasks:
+                in_flight.append(loop.run_in_executor(self.executor, parse_and_split, task))
+                if len(in_flight) >= window:
+                    yield await in_flight.pop(0)
+            while in_flight:
+                yield await in_flight.pop(0)
+        finally:
+            # Ranges not consumed yet (ingest failed or was cancelled) are dropped
+            for future in in_flight:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,17 +1,20 @@
-from langchain_ollama import OllamaEmbeddings
 from langchain_core.documents import Document
-from typing import List, Union, Tuple
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union, Tuple
 from pathlib import Path
 from .document_loader import DocumentLoader
 from .query_analyzer import QueryAnalyzer
 from .prompts import RAG_PROMPT
 from .source_processor import SourceProcessor
-from langsmith import Client, RunTree
 from dotenv import load_dotenv
+import asyncio
 import os
-from .retriever import DocumentRetriever
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from .logger import Logger
+from .retriever import DocumentRetriever, reciprocal_rank_fusion
+from .model_registry import model_registry
+from .embedding_cache import EmbeddingCache, CachedEmbeddings
+from .ingest_manifest import IngestManifest, SourceIngest, SourceLocks, assign_chunk_ids
+from .context_builder import ContextBuilder
+from .tracing import tracer, Span
+from .logger import Logger, SAMPLED
 
 logger = Logger.get_logger('processor')
 
@@ -20,6 +23,13 @@ ENV_PATH = ROOT_DIR / '.env'
 
 load_dotenv(dotenv_path=ENV_PATH)
 
+# Called with (stage, chunks_done) as ingestion advances
+ProgressCallback = Callable[[str, int], None]
+
+
+def _no_progress(stage: str, chunks_done: int) -> None:
+    pass
+
 class DocumentProcessor:
     def __init__(self, model: str = "deepseek-r1:7b"):
         logger.info(f"Initializing DocumentProcessor with model: {model}")
@@ -27,129 +37,394 @@ class DocumentProcessor:
         self.document_loader = DocumentLoader()
         self.query_analyzer = QueryAnalyzer(model)
         self.model = model
+        self.embedding_cache = EmbeddingCache()
         self._setup_embeddings(model)
         self.retriever = DocumentRetriever(self.embeddings, model)
+        self.ingest_manifest = IngestManifest()
+        self.source_locks = SourceLocks()
         self.vectorstore = None
         self.rag_prompt = RAG_PROMPT
-        self.langsmith_client = Client()
+        self.context_builder = ContextBuilder()
+        self.multi_query = os.getenv("MULTI_QUERY_RETRIEVAL", "true").lower() == "true"
+        self.analysis_deadline = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "2.0"))
 
     def _setup_embeddings(self, model: str):
         logger.info(f"Setting up embeddings for model: {model}")
-        if model in ["gpt-4o", "gpt-4o-mini"]:
-            self.embeddings = OpenAIEmbeddings(
-                api_key=os.getenv("OPENAI_API_KEY"),
-            )
-            logger.info("OpenAI embeddings configured")
-        else:
-            self.embeddings = OllamaEmbeddings(
-                model=model,
-                base_url=os.getenv("OLLAMA_BASE_URL"),
-            )
-            logger.info(f"Ollama embeddings configured for model {model}")
+        self.embeddings = CachedEmbeddings(
+            model_registry.get_lazy_embeddings(model),
+            model_registry.embedding_model_key(model),
+            self.embedding_cache
+        )
 
     def update_model(self, model: str):
         logger.info(f"Updating model to: {model}")
         self.model = model
         self.query_analyzer.update_model(model)
         self._setup_embeddings(model)
-        self.retriever.update_model(model)
+        # The retriever embeds queries and chunks, so it must follow the new embeddings too
+        self.retriever.update_model(model, self.embeddings)
 
-    async def load_and_split_documents(self, sources: List[Union[str, Path]]) -> List[Document]:
-        logger.info(f"Processing {len(sources)} sources")
+    async def ingest_sources(self, sources: List[Union[str, Path]],
+                             progress: Optional[ProgressCallback] = None) -> int:
+        """Load, split and index URLs and files, streaming splits in memory-bounded batches."""
+        progress = progress or _no_progress
+        logger.info("Processing %d sources", len(sources))
+        progress("loading", 0)
         processed_sources = self.source_processor.process_sources(sources)
-        logger.info(f"Found {len(processed_sources['urls'])} URLs and {len(processed_sources['files'])} files")
+        logger.info("Found %d URLs and %d files", len(processed_sources['urls']), len(processed_sources['files']))
         
         web_docs = await self.document_loader.load_web_documents(processed_sources['urls'])
-        logger.info(f"Loaded {len(web_docs)} web documents")
+        logger.info("Loaded %d web documents", len(web_docs))
 
-        file_docs = await self.document_loader.load_file_documents(processed_sources['files'])
-        logger.info(f"Loaded {len(file_docs)} file documents")
-        
-        # Combine web and file documents before splitting
-        all_docs = web_docs + file_docs
-        logger.info(f"Total documents to process: {len(all_docs)}")
-        
-        splits = await self.document_loader.process_documents(all_docs)
-        logger.info(f"Created {len(splits)} document splits")
-        
-        if splits:
-            self.retriever.create_vectorstore(splits)
+        pages: Dict[str, List[Document]] = {}
+        for doc in web_docs:
+            pages.setdefault(str(doc.metadata.get("source", "unknown")), []).append(doc)
+
+        async with self.source_locks.hold([*pages, *processed_sources['files']]):
+            # Sources whose content is unchanged since their last ingest are not split again
+            content_hashes = {
+                source: self.ingest_manifest.text_hash(doc.page_content for doc in docs)
+                for source, docs in pages.items()
+            }
+            for file in processed_sources['files']:
+                content_hashes[file] = await asyncio.to_thread(self.ingest_manifest.file_hash, file)
+            unchanged = {
+                source for source, content_hash in content_hashes.items()
+                if self.ingest_manifest.unchanged(source, content_hash)
+            }
+            if unchanged:
+                logger.info("Skipping %d unchanged sources", len(unchanged))
+            web_docs = [doc for source, docs in pages.items() if source not in unchanged for doc in docs]
+            files = [file for file in processed_sources['files'] if file not in unchanged]
+
+            async def batches():
+                async for batch in self.document_loader.iter_splits(web_docs):
+                    yield batch
+                async for batch in self.document_loader.batch_splits(self.document_loader.iter_files_splits(files)):
+                    yield batch
+
+            total = await self._index_stream(batches(), progress, stage="splitting", content_hashes=content_hashes)
+        logger.info("Created %s document splits", total)
+        return total
+
+    async def ingest_file_stream(self, file_path: Union[str, Path],
+                                 progress: Optional[ProgressCallback] = None,
+                                 source: Optional[str] = None) -> int:
+        """Split a file page by page and index it in memory-bounded batches.
+
+        ``source`` replaces the path in the chunks' metadata, so a file stored
+        under a per-upload path still replaces the previous version's chunks.
+        Ingests of the same source run one at a time.
+        """
+        path = str(file_path)
+        source = source or path
+        async with self.source_locks.hold([source]):
+            content_hash = await asyncio.to_thread(self.ingest_manifest.file_hash, path)
+            if self.ingest_manifest.unchanged(source, content_hash):
+                logger.info("%s is unchanged since its last ingest, skipping", source)
+                return 0
+            logger.info("Streaming ingestion of %s from %s", source, path)
+            splits = self.document_loader.batch_splits(self.document_loader.iter_file_splits(path))
+
+            async def labelled():
+                async for batch in splits:
+                    for doc in batch:
+                        doc.metadata["source"] = source
+                    yield batch
+
+            total = await self._index_stream(labelled(), progress or _no_progress, stage="parsing",
+                                             content_hashes={source: content_hash})
+        logger.info("Streamed %s splits from %s into the vectorstore", total, source)
+        return total
+
+    async def _index_stream(self, batches: AsyncIterator[List[Document]],
+                            progress: ProgressCallback, stage: str,
+                            content_hashes: Optional[Dict[str, str]] = None) -> int:
+        """Index batches of splits as they arrive, holding at most two batches at a time.
+
+        Chunks that the manifest already knows for their source are not
+        embedded again, near-duplicates of chunks already indexed are
+        dropped, and chunks the previous version of a source had but this
+        one lacks are deleted at the end. ``content_hashes`` are recorded for
+        the sources they cover, so the next ingest can skip them unchanged.
+        """
+        content_hashes = content_hashes or {}
+        ingests: Dict[str, SourceIngest] = {}
+        indexing: Optional[asyncio.Task] = None
+        total = 0
+        signed: List[str] = []
+        progress(stage, 0)
+
+        try:
+            async for splits in batches:
+                total += len(splits)
+                new_docs, new_ids = [], []
+                for doc in splits:
+                    source = str(doc.metadata.get("source", "unknown"))
+                    if source not in ingests:
+                        ingests[source] = self.ingest_manifest.stream(source, content_hashes.get(source))
+                    docs, ids = ingests[source].add([doc])
+                    new_docs.extend(docs)
+                    new_ids.extend(ids)
+                if new_docs and self.retriever.near_duplicate_detection:
+                    new_docs, new_ids = await asyncio.to_thread(
+                        self._drop_near_duplicates, new_docs, new_ids, ingests
+                    )
+                    signed.extend(new_ids)
+                if new_docs:
+                    # Embed this batch while the next one is split; at most
+                    # one batch is waiting on the embedding pipeline at a time
+                    if indexing:
+                        await indexing
+                    indexing = asyncio.create_task(self.retriever.create_vectorstore(new_docs, new_ids))
+                progress(stage, total)
+
+            progress("indexing", total)
+            if indexing:
+                await indexing
+        except BaseException:
+            if indexing and not indexing.done():
+                indexing.cancel()
+            # Chunks signed in this ingest may never have been stored
+            if signed:
+                self.retriever.load_near_duplicates().remove(signed)
+            raise
+
+        stale_ids = [chunk_id for ingest in ingests.values() for chunk_id in ingest.stale_ids()]
+        await asyncio.to_thread(self.retriever.delete_documents, stale_ids)
+        await asyncio.to_thread(self.ingest_manifest.commit_streams, list(ingests.values()))
+        if not ingests:
+            logger.info("No splits produced, nothing to index")
+
+        self.vectorstore = self.retriever.vectorstore
+        return total
+
+    def _drop_near_duplicates(self, docs: List[Document], ids: List[str],
+                              ingests: Dict[str, SourceIngest]) -> Tuple[List[Document], List[str]]:
+        """Filter out chunks that repeat one already indexed or earlier in this ingest."""
+        index = self.retriever.load_near_duplicates()
+        by_source: Dict[str, List[int]] = {}
+        for position, doc in enumerate(docs):
+            by_source.setdefault(str(doc.metadata.get("source", "unknown")), []).append(position)
+
+        kept = []
+        for source, positions in by_source.items():
+            ingest = ingests[source]
+            # The source's previous chunks are not matched: they may be deleted as stale
+            keep, duplicates = index.filter(
+                [ids[i] for i in positions], [docs[i].page_content for i in positions], exclude=ingest.known
+            )
+            kept.extend(positions[i] for i in keep)
+            if duplicates:
+                ingest.discard(list(duplicates))
+                logger.info("Dropped %d near-duplicate chunks from %s", len(duplicates), source)
+        kept.sort()
+        return [docs[i] for i in kept], [ids[i] for i in kept]
+
+    async def warm_up(self, readiness, snapshot_path: Optional[str] = None) -> None:
+        """Build the clients and open the index that construction deferred.
+
+        Steps run concurrently in threads and report to ``readiness``; a
+        failed step is logged and left to be retried on first use.
+        """
+        def step(name: str, build: Callable[[], object]):
+            def run():
+                with readiness.track(name):
+                    build()
+            return asyncio.to_thread(run)
+
+        readiness.expect("vectorstore", "embeddings", "chat_model")
+        results = await asyncio.gather(
+            step("vectorstore", self.retriever.open_vectorstore),
+            step("embeddings", lambda: self.embeddings.embeddings.backend),
+            step("chat_model", lambda: self.query_analyzer.chat_model),
+            return_exceptions=True,
+        )
+        if isinstance(results[0], Exception):
+            return
+
+        if self.retriever.retrieval_mode != "dense":
+            try:
+                await step("lexical_index", self.retriever.load_lexical_index)
+            except Exception:
+                pass
+
+        if snapshot_path:
+            readiness.expect("snapshot")
+            try:
+                with readiness.track("snapshot"):
+                    await self.warm_start(snapshot_path)
+            except Exception:
+                pass
+        elif await asyncio.to_thread(self.retriever.count_documents):
             self.vectorstore = self.retriever.vectorstore
-            logger.info("Vectorstore created and updated")
-            
-        return splits
+
+    async def warm_start(self, snapshot_path: Union[str, Path]) -> int:
+        """Fill an empty vectorstore from a snapshot without calling the embedding backend."""
+        from .index_snapshot import IndexSnapshot
+        snapshot = await asyncio.to_thread(IndexSnapshot, Path(snapshot_path))
+        model_key = self.embeddings.model_key
+        if snapshot.fingerprint["model"] != model_key:
+            logger.warning(
+                f"Snapshot {snapshot_path} was built with {snapshot.fingerprint['model']}, "
+                f"current embeddings are {model_key}; not loading it"
+            )
+            return 0
+        if await asyncio.to_thread(self.retriever.count_documents):
+            logger.info("Vectorstore already populated, skipping snapshot warm start")
+            self.vectorstore = self.retriever.vectorstore
+            return 0
+
+        loaded = await asyncio.to_thread(self._load_snapshot, snapshot)
+        self.vectorstore = self.retriever.vectorstore
+        logger.info(f"Warm started vectorstore with {loaded} chunks from {snapshot_path}")
+        return loaded
+
+    def _load_snapshot(self, snapshot) -> int:
+        chunks_by_source: Dict[str, List[str]] = {}
+        loaded = 0
+        for batch in snapshot.iter_batches():
+            self.retriever.add_embeddings(batch.ids, batch.texts, batch.metadatas, batch.embeddings.tolist())
+            for chunk_id, metadata in zip(batch.ids, batch.metadatas):
+                chunks_by_source.setdefault(str(metadata.get("source", "unknown")), []).append(chunk_id)
+            loaded += len(batch.ids)
+
+        # Later ingests of the same sources then skip the snapshot's chunks
+        for source, chunk_ids in chunks_by_source.items():
+            self.ingest_manifest.record_chunks(source, chunk_ids)
+        self.ingest_manifest.save()
+        return loaded
+
+    async def export_snapshot(self, snapshot_path: Union[str, Path]) -> int:
+        """Write the current vectorstore, vectors included, as a snapshot."""
+        from .index_snapshot import SnapshotWriter
+
+        def export():
+            writer = SnapshotWriter(Path(snapshot_path), self.embeddings.model_key)
+            for ids, texts, metadatas, embeddings in self.retriever.iter_stored():
+                writer.add(ids, texts, metadatas, embeddings)
+            writer.close()
+            return writer.count
+
+        return await asyncio.to_thread(export)
+
+    async def build_snapshot(self, documents: List[Document], snapshot_path: Union[str, Path]) -> int:
+        """Embed documents through the pipeline and write them as a snapshot."""
+        from .index_snapshot import SnapshotWriter
+        writer = SnapshotWriter(Path(snapshot_path), self.embeddings.model_key)
+        ids = assign_chunk_ids(documents)
+        batch_size = 1000
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            embeddings = await self.retriever.embedding_pipeline.embed([doc.page_content for doc in batch])
+            writer.add(ids[start:start + batch_size], [doc.page_content for doc in batch],
+                       [doc.metadata for doc in batch], embeddings)
+        await asyncio.to_thread(writer.close)
+        return writer.count
 
     async def get_relevant_context_async(self, query: str, k: int = 4) -> Tuple[str, dict]:
         if not self.vectorstore:
             logger.warning("No vectorstore available for context retrieval")
             return "", {}
             
-        logger.info(f"Getting relevant context for query: {query}")
-        parent_run = RunTree(
-            name="Get Relevant Context",
-            inputs={"query": query},
-            project_name="promtior-rag",
-        )
-        parent_run.post()
+        logger.info("Getting relevant context for query: %s", query, extra=SAMPLED)
+        parent_run = tracer.start_span("Get Relevant Context", {"query": query})
         
         try:
-            analysis_run = RunTree(
-                name="analyze_query",
-                inputs={"query": query},
-                parent_run=parent_run,
-                project_name="promtior-rag"
-            )
-            analysis_run.post()
-            
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.analysis_deadline
+
+            # Retrieval for the raw question does not depend on the analysis,
+            # so both start right away and the analysis only widens the search
+            # if it lands before the deadline.
+            analysis_task = asyncio.create_task(self._analyze(query, parent_run))
+            search_run = parent_run.child("search_documents", {"query": query})
+
             try:
-                analysis = await self.query_analyzer.analyze_query(query)
-                logger.info(f"Query analysis completed: {analysis}")
-                analysis_run.end(outputs=analysis)
-                analysis_run.post()
+                ranked_lists = await self.retriever.search_ranked([query], n_results=k*2)
             except Exception as e:
-                logger.error(f"Error in query analysis: {str(e)}")
-                analysis_run.end(error=str(e))
-                analysis_run.post()
+                logger.error("Error retrieving documents: %s", e)
+                search_run.end(error=str(e))
+                analysis_task.cancel()
                 raise
-            
-            search_run = RunTree(
-                name="search_documents",
-                inputs={"query": query},
-                parent_run=parent_run,
-                project_name="promtior-rag"
-            )
-            search_run.post()
-            
+
             try:
-                relevant_docs = await self.retriever.get_relevant_documents(query, k=k)
-                logger.info(f"Retrieved {len(relevant_docs)} relevant documents")
+                analysis = await asyncio.wait_for(analysis_task, timeout=max(0.0, deadline - loop.time()))
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    logger.warning("Query analysis exceeded %ss deadline, using direct search", self.analysis_deadline)
+                else:
+                    logger.warning("Query analysis failed, using direct search: %s", e)
+                analysis = {
+                    "analysis": "Using direct search",
+                    "queries": [query]
+                }
+
+            extra_queries = []
+            if self.multi_query:
+                extra_queries = [
+                    q for q in dict.fromkeys(analysis.get("queries", []))
+                    if isinstance(q, str) and q.strip() and q.strip() != query.strip()
+                ]
+
+            try:
+                if extra_queries:
+                    ranked_lists += await self.retriever.search_ranked(extra_queries, n_results=k*2)
+                # Fuse a wider pool than k so the context builder has alternatives to redundant chunks
+                relevant_docs = reciprocal_rank_fusion(ranked_lists, k*2)
+                logger.info("Retrieved %d relevant documents from %d queries", len(relevant_docs), len(ranked_lists), extra=SAMPLED)
                 search_run.end(outputs={
+                    "queries": [query] + extra_queries,
                     "docs_found": len(relevant_docs),
                     "total_context_length": sum(len(doc.page_content) for doc in relevant_docs)
                 })
-                search_run.post()
             except Exception as e:
-                logger.error(f"Error retrieving documents: {str(e)}")
+                logger.error("Error retrieving documents: %s", e)
                 search_run.end(error=str(e))
-                search_run.post()
                 raise
         
-            context = "\n\n".join(doc.page_content for doc in relevant_docs)
-            logger.info(f"Generated context with length: {len(context)}")
+            context, packing = await self._build_context(query, relevant_docs, k)
+            logger.info("Generated context with length: %d", len(context), extra=SAMPLED)
             
-            parent_run.end(outputs={"context_length": len(context)})
-            parent_run.post()
+            parent_run.end(outputs={"context_length": len(context), "context_packing": packing})
             
             return context, analysis
             
         except Exception as e:
-            logger.error(f"Error in context retrieval: {str(e)}")
+            logger.error("Error in context retrieval: %s", e)
             parent_run.end(error=str(e))
-            parent_run.post()
+            raise
+
+    async def _build_context(self, query: str, documents: List[Document], k: int) -> Tuple[str, dict]:
+        """Pack the fused results into the prompt context, diversified by MMR where vectors are at hand."""
+        query_vector, doc_vectors = None, None
+        # Lexical mode never embeds; elsewhere the query vector is already cached by the search
+        if self.context_builder.mmr_enabled and self.retriever.retrieval_mode != "lexical":
+            try:
+                query_vector = (await self.retriever.embed_queries([query]))[0]
+                doc_vectors = await self.retriever.document_embeddings(documents)
+            except Exception as e:
+                logger.warning("Embeddings unavailable for MMR, packing in rank order: %s", e)
+        return self.context_builder.build(documents, k, query_vector, doc_vectors)
+
+    async def _analyze(self, query: str, parent_run: Span) -> dict:
+        analysis_run = parent_run.child("analyze_query", {"query": query})
+
+        try:
+            analysis = await self.query_analyzer.analyze_query(query)
+            logger.info("Query analysis completed: %s", analysis, extra=SAMPLED)
+            analysis_run.end(outputs=analysis)
+            return analysis
+        except asyncio.CancelledError:
+            analysis_run.end(error="Cancelled after analysis deadline")
+            raise
+        except Exception as e:
+            logger.error("Error in query analysis: %s", e)
+            analysis_run.end(error=str(e))
             raise
 
     def get_rag_prompt(self, question: str, context: str) -> str:
-        logger.info("Generating RAG prompt")
+        logger.info("Generating RAG prompt", extra=SAMPLED)
         return self.rag_prompt.format(context=context, question=question)
 
     def process_documents(self, documents: List[Document]) -> List[Document]:
@@ -158,7 +433,7 @@ class DocumentProcessor:
         
         for doc in documents:
             if doc.metadata.get('type') == 'social_media' and 'linkedin.com' in doc.metadata.get('source', ''):
-                logger.info("Processing LinkedIn document")
+                logger.info("Processing LinkedIn document", extra=SAMPLED)
                 sections = doc.page_content.split('\n\n')
                 for section in sections:
                     if section.strip():
@@ -190,4 +465,4 @@ class DocumentProcessor:
         elif 'content from' in content_lower:
             return 'additional_content'
         else:
-            return 'general' 
\ No newline at end of file
+            return 'general'
@@ -1,11 +1,9 @@
-from langchain_ollama import ChatOllama
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
 import json
 import re
 from .prompts import QUERY_ANALYZER_PROMPT
-import os
-from .logger import Logger
+from .model_registry import model_registry
+from .logger import Logger, SAMPLED
 
 logger = Logger.get_logger('query_analyzer')
 
@@ -13,34 +11,27 @@ class QueryAnalyzer:
     def __init__(self, model: str = "deepseek-r1:7b"):
         logger.info(f"Initializing QueryAnalyzer with model: {model}")
         self.model = model
-        self._setup_chat_model(model)
+        self._chat_model = None
         self.prompt = QUERY_ANALYZER_PROMPT
 
-    def _setup_chat_model(self, model: str):
-        logger.info(f"Setting up chat model: {model}")
-        if model in ["gpt-4o", "gpt-4o-mini"]:
-            self.chat_model = ChatOpenAI(
-                api_key=os.getenv("OPENAI_API_KEY"),
-                model=model
-            )
-            logger.info(f"OpenAI chat model {model} configured")
-        else:
-            self.chat_model = ChatOllama(
-                model=model,
-                base_url=os.getenv("OLLAMA_BASE_URL")
-            )
-            logger.info(f"Ollama chat model configured for {model}")
+    @property
+    def chat_model(self):
+        # Built on first use so constructing the analyzer stays cheap
+        if self._chat_model is None:
+            logger.info(f"Setting up chat model: {self.model}")
+            self._chat_model = model_registry.get_chat_model(self.model)
+        return self._chat_model
 
     def update_model(self, model: str):
         logger.info(f"Updating model to: {model}")
         self.model = model
-        self._setup_chat_model(model)
+        self._chat_model = None
 
     async def analyze_query(self, user_question: str) -> dict:
         try:
-            logger.info(f"Analyzing query: {user_question}")
+            logger.info("Analyzing query: %s", user_question, extra=SAMPLED)
             clean_question = re.sub(r'@https?://\S+', '', user_question).strip()
-            logger.info(f"Cleaned question: {clean_question}")
+            logger.info("Cleaned question: %s", clean_question, extra=SAMPLED)
             
             prompt = self.prompt.format(question=clean_question)
             response = await self.chat_model.ainvoke(prompt)
@@ -49,15 +40,15 @@ class QueryAnalyzer:
                 content = response.content.strip()
                 content = re.sub(r'^```json\s*|\s*```$', '', content)
                 analysis = json.loads(content)
-                logger.info(f"Query analysis completed successfully: {analysis}")
+                logger.info("Query analysis completed successfully: %s", analysis, extra=SAMPLED)
                 return analysis
                 
             except json.JSONDecodeError as e:
-                logger.warning(f"JSON decode error, using fallback analysis: {str(e)}")
+                logger.warning("JSON decode error, using fallback analysis: %s", e)
                 return self._fallback_analysis(clean_question, e, response.content)
                 
         except Exception as e:
-            logger.error(f"Error analyzing query: {str(e)}")
+            logger.error("Error analyzing query: %s", e)
             return self._error_analysis(clean_question, e)
 
     def _fallback_analysis(self, question: str, error: Exception, raw_response: str) -> dict:
@@ -72,7 +63,7 @@ class QueryAnalyzer:
         }
 
     def _error_analysis(self, question: str, error: Exception) -> dict:
-        logger.warning(f"Error in analysis, using direct search: {str(error)}")
+        logger.warning("Error in analysis, using direct search: %s", error)
         return {
             "analysis": "Using direct search",
             "queries": [question]
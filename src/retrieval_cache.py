@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import hashlib
+import os
+import struct
+import threading
+import time
+from .embedding_cache import normalize_text
+from .logger import Logger
+
+logger = Logger.get_logger('retrieval_cache')
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after a fixed age."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def vector_key(vector: List[float]) -> str:
+    """Compact hashable key for a query embedding."""
+    return hashlib.sha1(struct.pack(f"{len(vector)}f", *vector)).hexdigest()
+
+
+class RetrievalCache:
+    """Two levels in front of dense search.
+
+    Query text -> embedding skips the embedding backend for repeated
+    questions; (embedding, k, filters, corpus version) -> ranked chunk IDs
+    skips the vector search. Result entries are dropped whenever the corpus
+    changes, and the corpus version in their key keeps a late write from a
+    search that raced with an ingest unreachable.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+        self.embeddings = TTLCache(
+            int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "2048")),
+            float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400")),
+        )
+        self.results = TTLCache(
+            int(os.getenv("RETRIEVAL_RESULT_CACHE_MAX_ENTRIES", "1024")),
+            float(os.getenv("RETRIEVAL_RESULT_CACHE_TTL_SECONDS", "600")),
+        )
+
+    @staticmethod
+    def embedding_key(model_key: str, query: str) -> Tuple[str, str]:
+        return model_key, normalize_text(query)
+
+    @staticmethod
+    def result_key(embedding: List[float], k: int, filters: Dict[str, Any], corpus_version: int) -> tuple:
+        return vector_key(embedding), k, tuple(sorted(filters.items())), corpus_version
+
+    def invalidate_results(self) -> None:
+        self.results.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "query_embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+        }
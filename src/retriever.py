@@ -1,42 +1,65 @@
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
-from langchain_core.runnables import RunnableConfig
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
 import os
+import threading
+import uuid
 from pathlib import Path
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from .logger import Logger
+from langchain_core.prompts import PromptTemplate
+from .model_registry import model_registry
+from .embedding_pipeline import EmbeddingPipeline
+from .lexical_index import BM25Index
+from .retrieval_cache import RetrievalCache
+from .logger import Logger, SAMPLED
 
 logger = Logger.get_logger('retriever')
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 PERSIST_DIR = ROOT_DIR / "chroma_db"
 PERSIST_DIR.mkdir(exist_ok=True)
+RRF_K = 60
+DOCUMENT_FIELDS = ("id", "metadata", "content")
+RETRIEVAL_MODES = ("dense", "hybrid", "lexical")
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Document]], k: int, rrf_k: int = RRF_K) -> List[Document]:
+    """Merge several ranked result lists, deduplicating on page content."""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ordered[:k]]
 
 class DocumentRetriever:
     def __init__(self, embeddings, model: str = "deepseek-r1:7b", vectorstore=None):
         logger.info(f"Initializing DocumentRetriever with model: {model}")
         self.embeddings = embeddings
+        self.embedding_pipeline = EmbeddingPipeline(embeddings)
         self.model = model
-        self._setup_llm(model)
-        
-        # Initialize vectorstore from disk if it exists
-        if vectorstore:
-            self.vectorstore = vectorstore
-        else:
-            try:
-                self.vectorstore = Chroma(
-                    persist_directory=str(PERSIST_DIR),
-                    embedding_function=embeddings
-                )
-                logger.info("Loaded existing vectorstore from disk")
-            except Exception as e:
-                logger.info("No existing vectorstore found, will create new one when documents are added")
-                self.vectorstore = None
+        self.corpus_version = 0
+        self._llm = None
+        # The on-disk vectorstore is opened on first use (or by warm-up)
+        self._vectorstore = vectorstore
+        self._vectorstore_opened = vectorstore is not None
+        self._vectorstore_lock = threading.Lock()
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            logger.warning(f"Unknown RETRIEVAL_MODE {self.retrieval_mode}, using dense")
+            self.retrieval_mode = "dense"
+        self.lexical_index = BM25Index()
+        self.retrieval_cache = RetrievalCache()
+        self._lexical_loaded = False
+        self._lexical_lock = threading.Lock()
+        self.near_duplicate_detection = os.getenv("NEAR_DUPLICATE_DETECTION", "true").lower() == "true"
+        self._near_duplicates = None
+        self._near_duplicates_lock = threading.Lock()
 
         self.query_prompt = PromptTemplate(
             input_variables=["question"],
@@ -54,70 +77,297 @@ class DocumentRetriever:
             DO NOT include any prefixes or explanations. Return ONLY the search queries, one per line."""
         )
 
-    def _setup_llm(self, model: str):
-        logger.info(f"Setting up LLM for model: {model}")
-        if model in ["gpt-4o", "gpt-4o-mini"]:
-            self.llm = ChatOpenAI(
-                api_key=os.getenv("OPENAI_API_KEY"),
-                model=model,
-                callbacks=[]
-            )
-            logger.info(f"OpenAI LLM {model} configured")
-        else:
-            self.llm = ChatOllama(
-                model=model,
-                base_url=os.getenv("OLLAMA_BASE_URL"),
-                callbacks=[]
-            )
-            logger.info(f"Ollama LLM configured for {model}")
+    @property
+    def llm(self):
+        if self._llm is None:
+            logger.info(f"Setting up LLM for model: {self.model}")
+            self._llm = model_registry.get_chat_model(self.model)
+        return self._llm
 
-    def update_model(self, model: str):
+    def update_model(self, model: str, embeddings=None):
+        """Switch the chat model and, when given, the embeddings used for queries and ingestion."""
         logger.info(f"Updating model to: {model}")
         self.model = model
-        self._setup_llm(model)
+        self._llm = None
+        if embeddings is not None:
+            self.embeddings = embeddings
+            self.embedding_pipeline = EmbeddingPipeline(embeddings)
+
+    @property
+    def vectorstore(self):
+        if not self._vectorstore_opened:
+            try:
+                self.open_vectorstore()
+            except Exception as e:
+                logger.error(f"Could not open the {self.vector_backend} vectorstore: {str(e)}")
+                with self._vectorstore_lock:
+                    if not self._vectorstore_opened:
+                        self._vectorstore = None
+                        self._vectorstore_opened = True
+        return self._vectorstore
+
+    @vectorstore.setter
+    def vectorstore(self, vectorstore) -> None:
+        self._vectorstore = vectorstore
+        self._vectorstore_opened = True
+
+    def _create_backend(self):
+        # Imported here so chromadb and numpy are only loaded once the index is needed
+        from .vector_backends import VECTOR_BACKENDS, create_backend
+        if self.vector_backend not in VECTOR_BACKENDS:
+            logger.warning(f"Unknown VECTOR_BACKEND {self.vector_backend}, using chroma")
+            self.vector_backend = "chroma"
+        return create_backend(self.vector_backend, self.embeddings)
 
-    def create_vectorstore(self, documents: List[Document]) -> None:
+    def open_vectorstore(self):
+        """Open the on-disk index now, raising if it cannot be opened (used by warm-up)."""
+        with self._vectorstore_lock:
+            if not self._vectorstore_opened:
+                self._vectorstore = self._create_backend()
+                self._vectorstore_opened = True
+                logger.info(f"Loaded existing {self.vector_backend} vectorstore from disk")
+        return self._vectorstore
+
+    async def create_vectorstore(self, documents: List[Document], ids: Optional[List[str]] = None) -> None:
         if not documents:
             logger.warning("No documents provided for vectorstore creation")
             return
 
-        logger.info(f"Creating vectorstore with {len(documents)} documents")
+        logger.info("Creating vectorstore with %d documents", len(documents))
+
+        # Embed through the batched pipeline, then write the vectors directly
+        # so the vectorstore does not embed everything again in one call
+        texts = [doc.page_content for doc in documents]
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        embeddings = await self.embedding_pipeline.embed(texts)
+        await asyncio.to_thread(self.add_embeddings, ids, texts, [doc.metadata for doc in documents], embeddings)
+        logger.info("Documents added to vectorstore and persisted")
+
+    def add_embeddings(self, ids: List[str], texts: List[str], metadatas: List[dict],
+                       embeddings: List[List[float]]) -> None:
+        """Store chunks whose vectors are already computed."""
         if not self.vectorstore:
-            self.vectorstore = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                persist_directory=str(PERSIST_DIR)
-            )
-            self.vectorstore.persist()
-            logger.info("New vectorstore created and persisted")
-        else:
-            self.vectorstore.add_documents(documents)
-            self.vectorstore.persist()
-            logger.info("Documents added to existing vectorstore and persisted")
-
-    async def get_relevant_documents(self, query: str, k: int = 4) -> List[Document]:
+            self.vectorstore = self._create_backend()
+            logger.info(f"New {self.vector_backend} vectorstore created")
+        self.vectorstore.upsert(ids, texts, metadatas, embeddings)
+        if self.retrieval_mode != "dense":
+            self.lexical_index.add(ids, texts, metadatas)
+        self.corpus_version += 1
+        self.retrieval_cache.invalidate_results()
+
+    def iter_stored(self, batch_size: int = 1000, embeddings: bool = True):
+        """Yield (ids, texts, metadatas, embeddings) for everything in the collection."""
+        if not self.vectorstore:
+            return
+        include = ["documents", "metadatas"] + (["embeddings"] if embeddings else [])
+        offset = 0
+        while True:
+            results = self.vectorstore.get(limit=batch_size, offset=offset, include=include)
+            if not len(results["ids"]):
+                break
+            yield results["ids"], results["documents"], results["metadatas"], results.get("embeddings")
+            offset += len(results["ids"])
+
+    def load_lexical_index(self) -> BM25Index:
+        """Index the chunks already stored on disk; later adds and deletes keep it current."""
+        if not self._lexical_loaded:
+            with self._lexical_lock:
+                if not self._lexical_loaded:
+                    for ids, texts, metadatas, _ in self.iter_stored(embeddings=False):
+                        self.lexical_index.add(ids, texts, [metadata or {} for metadata in metadatas])
+                    self._lexical_loaded = True
+                    logger.info(f"Lexical index loaded with {len(self.lexical_index)} chunks")
+        return self.lexical_index
+
+    def load_near_duplicates(self):
+        """Sign the chunks already stored on disk; ingestion and deletes keep the index current."""
+        if self._near_duplicates is None:
+            with self._near_duplicates_lock:
+                if self._near_duplicates is None:
+                    # Imported here so numpy is only loaded once something is ingested
+                    from .near_duplicates import NearDuplicateIndex
+                    index = NearDuplicateIndex()
+                    for ids, texts, _, _ in self.iter_stored(embeddings=False):
+                        index.add(ids, texts)
+                    self._near_duplicates = index
+                    logger.info(f"Near-duplicate index loaded with {len(index)} chunks")
+        return self._near_duplicates
+
+    def delete_documents(self, ids: List[str]) -> None:
+        if not ids or not self.vectorstore:
+            return
+
+        logger.info("Deleting %d stale chunks from vectorstore", len(ids))
+        self.vectorstore.delete(ids)
+        self.lexical_index.remove(ids)
+        if self._near_duplicates is not None:
+            self._near_duplicates.remove(ids)
+        self.corpus_version += 1
+        self.retrieval_cache.invalidate_results()
+
+    def list_documents(self, limit: int, offset: int = 0, source: Optional[str] = None,
+                       doc_type: Optional[str] = None,
+                       fields: Sequence[str] = DOCUMENT_FIELDS) -> Tuple[List[dict], bool]:
+        """Return one page of stored chunks and whether more follow.
+
+        Reads straight from the collection, so only the requested page and
+        fields are loaded however large the corpus is.
+        """
         if not self.vectorstore:
-            logger.warning("No vectorstore available for document retrieval")
-            return []
-
-        logger.info(f"Retrieving documents for query: {query} with k={k}")
-        retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={
-                "k": k*2
-            }
+            return [], False
+
+        filters = []
+        if source:
+            filters.append({"source": source})
+        if doc_type:
+            filters.append({"type": doc_type})
+        where = None
+        if len(filters) == 1:
+            where = filters[0]
+        elif filters:
+            where = {"$and": filters}
+
+        include = []
+        if "metadata" in fields:
+            include.append("metadatas")
+        if "content" in fields:
+            include.append("documents")
+
+        # One extra row tells whether there is a next page
+        results = self.vectorstore.get(
+            where=where,
+            limit=limit + 1,
+            offset=offset,
+            include=include,
         )
-        
-        docs = await retriever.ainvoke(query)
-        logger.info(f"Retrieved {len(docs)} initial documents")
-        
-        seen = set()
-        unique_docs = []
-        for doc in docs:
-            if doc.page_content not in seen:
-                seen.add(doc.page_content)
-                unique_docs.append(doc)
-
-        final_docs = unique_docs[:k]
-        logger.info(f"Returning {len(final_docs)} unique documents")
-        return final_docs
\ No newline at end of file
+
+        rows = []
+        for i, chunk_id in enumerate(results["ids"][:limit]):
+            row = {}
+            if "id" in fields:
+                row["id"] = chunk_id
+            if "metadata" in fields:
+                row["metadata"] = results["metadatas"][i] or {}
+            if "content" in fields:
+                row["content"] = results["documents"][i]
+            rows.append(row)
+        return rows, len(results["ids"]) > limit
+
+    def count_documents(self) -> int:
+        return self.vectorstore.count() if self.vectorstore else 0
+
+    def vector_stats(self) -> dict:
+        # Read without opening the index, so /stats never triggers a load
+        stats = {"backend": self.vector_backend}
+        if self._vectorstore is not None:
+            stats.update(self._vectorstore.stats())
+        return stats
+
+    def near_duplicate_stats(self) -> dict:
+        stats = {"enabled": self.near_duplicate_detection}
+        if self._near_duplicates is not None:
+            stats.update(self._near_duplicates.stats())
+        return stats
+
+    async def search_ranked(self, queries: List[str], n_results: int) -> List[List[Document]]:
+        """Return one ranked document list per query, following RETRIEVAL_MODE.
+
+        hybrid fuses the dense and BM25 rankings with RRF and falls back to
+        BM25 alone if the embedding backend fails; lexical never embeds.
+        """
+        if self.retrieval_mode == "dense":
+            return await self._dense_search(queries, n_results)
+
+        lexical_index = await asyncio.to_thread(self.load_lexical_index)
+        lexical_lists = [self._lexical_search(lexical_index, query, n_results) for query in queries]
+        if self.retrieval_mode == "lexical":
+            return lexical_lists
+
+        try:
+            dense_lists = await self._dense_search(queries, n_results)
+        except Exception as e:
+            logger.warning("Dense search failed, answering from the lexical index: %s", e)
+            return lexical_lists
+        return [
+            reciprocal_rank_fusion([dense, lexical], n_results)
+            for dense, lexical in zip(dense_lists, lexical_lists)
+        ]
+
+    @staticmethod
+    def _lexical_search(lexical_index: BM25Index, query: str, n_results: int) -> List[Document]:
+        ranked = []
+        for chunk_id, _ in lexical_index.search(query, n_results):
+            text, metadata = lexical_index.get(chunk_id)
+            ranked.append(Document(page_content=text, metadata=metadata, id=chunk_id))
+        return ranked
+
+    async def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed queries, sending only ones not seen recently to the backend.
+
+        Queries go through ``embed_query``, bypassing the persistent chunk
+        cache, so the retrieval cache is the only place query vectors live.
+        """
+        cache = self.retrieval_cache
+        model_key = getattr(self.embeddings, "model_key", "")
+        keys = [cache.embedding_key(model_key, query) for query in queries]
+        vectors = [cache.embeddings.get(key) if cache.enabled else None for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = await asyncio.gather(*(
+                asyncio.to_thread(self.embeddings.embed_query, queries[i]) for i in missing
+            ))
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                if cache.enabled:
+                    cache.embeddings.put(keys[i], vector)
+        return vectors
+
+    async def _dense_search(self, queries: List[str], n_results: int,
+                            filters: Optional[Dict[str, str]] = None) -> List[List[Document]]:
+        filters = filters or {}
+        cache = self.retrieval_cache
+        corpus_version = self.corpus_version
+        query_embeddings = await self.embed_queries(queries)
+        keys = [cache.result_key(embedding, n_results, filters, corpus_version) for embedding in query_embeddings]
+        ranked_ids: List[Optional[List[str]]] = [cache.results.get(key) if cache.enabled else None for key in keys]
+        documents: Dict[str, Document] = {}
+
+        missing = [i for i, ids in enumerate(ranked_ids) if ids is None]
+        if missing:
+            results = await asyncio.to_thread(
+                self.vectorstore.query,
+                [query_embeddings[i] for i in missing],
+                n_results,
+                filters or None,
+            )
+            for i, ids, texts, metadatas in zip(missing, results["ids"], results["documents"], results["metadatas"]):
+                ranked_ids[i] = list(ids)
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    documents[chunk_id] = Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+                if cache.enabled:
+                    cache.results.put(keys[i], list(ids))
+
+        # Cache hits only stored IDs; fetch their text in one local read
+        unresolved = list(dict.fromkeys(
+            chunk_id for ids in ranked_ids for chunk_id in ids if chunk_id not in documents
+        ))
+        if unresolved:
+            stored = await asyncio.to_thread(
+                self.vectorstore.get, ids=unresolved, include=["documents", "metadatas"]
+            )
+            for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                documents[chunk_id] = Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+
+        return [[documents[chunk_id] for chunk_id in ids if chunk_id in documents] for ids in ranked_ids]
+
+    async def document_embeddings(self, documents: List[Document]) -> Optional[List[List[float]]]:
+        """Stored vectors of search results, in order; None if any is missing."""
+        ids = [doc.id for doc in documents]
+        if not documents or not self.vectorstore or not all(ids):
+            return None
+        stored = await asyncio.to_thread(self.vectorstore.get, ids=ids, include=["embeddings"])
+        vectors = dict(zip(stored["ids"], stored["embeddings"]))
+        if len(vectors) < len(set(ids)):
+            return None
+        return [vectors[chunk_id] for chunk_id in ids]
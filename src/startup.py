@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from typing import Dict
+import os
+import threading
+import time
+from .logger import Logger
+
+logger = Logger.get_logger('startup')
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """Per-component warm-up state and timing, reported by /ready."""
+
+    def __init__(self):
+        self.mode = os.getenv("STARTUP_MODE", "lazy").lower()
+        self.started_at = time.time()
+        self.components: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def expect(self, *names: str) -> None:
+        with self._lock:
+            for name in names:
+                self.components.setdefault(name, {"status": PENDING, "seconds": None})
+
+    @contextmanager
+    def track(self, name: str):
+        self.expect(name)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._set(name, FAILED, time.perf_counter() - started, error=str(e))
+            logger.error(f"Warm-up of {name} failed: {str(e)}")
+            raise
+        self._set(name, READY, time.perf_counter() - started)
+        logger.info(f"{name} ready in {time.perf_counter() - started:.2f}s")
+
+    def _set(self, name: str, status: str, seconds: float, **extra) -> None:
+        with self._lock:
+            self.components[name] = {"status": status, "seconds": round(seconds, 3), **extra}
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return bool(self.components) and all(c["status"] == READY for c in self.components.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "ready": bool(self.components) and all(c["status"] == READY for c in self.components.values()),
+                "mode": self.mode,
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "components": {name: dict(state) for name, state in self.components.items()},
+            }
+
+
+readiness = Readiness()
@@ -0,0 +1,224 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import os
+import queue
+import random
+import threading
+import uuid
+from .logger import Logger
+
+logger = Logger.get_logger('tracing')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PROJECT_NAME = os.getenv("LANGCHAIN_PROJECT", "promtior-rag")
+
+
+class NoopSink:
+    def export(self, events: List[dict]) -> None:
+        pass
+
+
+class FileSink:
+    """Append span events as JSON lines, for local runs and benchmarks."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or os.getenv("TRACE_FILE", ROOT_DIR / "logs" / "traces.jsonl"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, events: List[dict]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, default=str) + "\n")
+
+
+class LangSmithSink:
+    """Forward span events to LangSmith as run creates and updates."""
+
+    def __init__(self, project_name: str = PROJECT_NAME):
+        self.project_name = project_name
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from langsmith import Client
+            self._client = Client()
+        return self._client
+
+    def export(self, events: List[dict]) -> None:
+        for event in events:
+            try:
+                if event["event"] == "start":
+                    self.client.create_run(
+                        name=event["name"],
+                        inputs=event["inputs"],
+                        run_type="chain",
+                        id=event["id"],
+                        trace_id=event["trace_id"],
+                        dotted_order=event["dotted_order"],
+                        parent_run_id=event["parent_id"],
+                        start_time=event["time"],
+                        project_name=self.project_name,
+                    )
+                else:
+                    self.client.update_run(
+                        event["id"],
+                        trace_id=event["trace_id"],
+                        dotted_order=event["dotted_order"],
+                        parent_run_id=event["parent_id"],
+                        end_time=event["time"],
+                        outputs=event["outputs"],
+                        error=event["error"],
+                    )
+            except Exception as e:
+                logger.warning("Failed to export span %s: %s", event['name'], e)
+
+
+SINKS = {
+    "langsmith": LangSmithSink,
+    "file": FileSink,
+    "none": NoopSink,
+}
+
+
+@dataclass
+class Span:
+    name: str
+    inputs: Dict[str, Any]
+    exporter: "TraceExporter"
+    sampled: bool
+    parent: Optional["Span"] = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    start_time: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    end_time: Optional[datetime] = None
+
+    def __post_init__(self):
+        self.trace_id = self.parent.trace_id if self.parent else self.id
+        order = f"{self.start_time.strftime('%Y%m%dT%H%M%S%fZ')}{self.id}"
+        self.dotted_order = f"{self.parent.dotted_order}.{order}" if self.parent else order
+
+    def child(self, name: str, inputs: Optional[Dict[str, Any]] = None) -> "Span":
+        return self.exporter.start_span(name, inputs, parent=self)
+
+    def end(self, outputs: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """Close the span; later calls are ignored."""
+        if self.end_time is not None:
+            return
+        self.end_time = datetime.now(timezone.utc)
+        self.exporter._emit(self, "end", outputs=outputs, error=error)
+
+
+class TraceExporter:
+    """Queue span events in memory and flush them in batches from a background thread.
+
+    Requests only ever do a non-blocking put; when the queue is full the event
+    is dropped and counted instead of waiting on the sink.
+    """
+
+    def __init__(self, sink=None, max_queue: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, sample_rate: Optional[float] = None):
+        if sink is None:
+            sink = SINKS.get(os.getenv("TRACE_EXPORTER", "langsmith"), NoopSink)()
+        self.sink = sink
+        self.batch_size = batch_size or int(os.getenv("TRACE_BATCH_SIZE", "100"))
+        self.flush_interval = flush_interval or float(os.getenv("TRACE_FLUSH_INTERVAL", "1.0"))
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_queue or int(os.getenv("TRACE_QUEUE_SIZE", "10000")))
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.exported = 0
+        self.dropped = 0
+        self.unsampled = 0
+
+    def start_span(self, name: str, inputs: Optional[Dict[str, Any]] = None,
+                   parent: Optional[Span] = None) -> Span:
+        # Sampling is decided once per trace so a trace is never half exported
+        sampled = parent.sampled if parent else random.random() < self.sample_rate
+        span = Span(name=name, inputs=inputs or {}, exporter=self, sampled=sampled, parent=parent)
+        self._emit(span, "start")
+        return span
+
+    def _emit(self, span: Span, event: str, outputs: Optional[dict] = None, error: Optional[str] = None) -> None:
+        if not span.sampled:
+            self.unsampled += 1
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait({
+                "event": event,
+                "id": span.id,
+                "trace_id": span.trace_id,
+                "parent_id": span.parent.id if span.parent else None,
+                "dotted_order": span.dotted_order,
+                "name": span.name,
+                "inputs": span.inputs,
+                "outputs": outputs,
+                "error": error,
+                "time": span.start_time if event == "start" else span.end_time,
+            })
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _drain(self, block: bool) -> List[dict]:
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _export(self, batch: List[dict]) -> None:
+        try:
+            self.sink.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            logger.warning("Trace sink failed, dropping %d events: %s", len(batch), e)
+            self.dropped += len(batch)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._export(batch)
+
+    def flush(self) -> None:
+        """Export everything currently queued from the calling thread."""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._export(batch)
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "sink": type(self.sink).__name__,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "unsampled": self.unsampled,
+            "sample_rate": self.sample_rate,
+        }
+
+
+tracer = TraceExporter()
@@ -0,0 +1,399 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import os
+import threading
+import numpy as np
+from .logger import Logger, SAMPLED
+from .vector_compression import SCORE_BLOCK_ROWS, VectorCompressor
+
+logger = Logger.get_logger('vector_backends')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+CHROMA_DIR = ROOT_DIR / "chroma_db"
+NUMPY_INDEX_DIR = ROOT_DIR / "numpy_index"
+
+
+class ChromaBackend:
+    """The persisted Chroma collection, behind the calls DocumentRetriever makes."""
+
+    def __init__(self, embeddings, persist_dir: Path = CHROMA_DIR):
+        # Imported here so chromadb is only loaded once the index is needed
+        from langchain_community.vectorstores import Chroma
+        self.store = Chroma(persist_directory=str(persist_dir), embedding_function=embeddings)
+        self.collection = self.store._collection
+
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[dict], embeddings) -> None:
+        # Chroma rejects empty metadata dicts, so those rows go in without metadata
+        with_metadata = [i for i, metadata in enumerate(metadatas) if metadata]
+        without_metadata = [i for i, metadata in enumerate(metadatas) if not metadata]
+        if with_metadata:
+            self.collection.upsert(
+                ids=[ids[i] for i in with_metadata],
+                embeddings=[embeddings[i] for i in with_metadata],
+                metadatas=[metadatas[i] for i in with_metadata],
+                documents=[texts[i] for i in with_metadata],
+            )
+        if without_metadata:
+            self.collection.upsert(
+                ids=[ids[i] for i in without_metadata],
+                embeddings=[embeddings[i] for i in without_metadata],
+                documents=[texts[i] for i in without_metadata],
+            )
+        self.store.persist()
+
+    def delete(self, ids: List[str]) -> None:
+        self.store.delete(ids=ids)
+        self.store.persist()
+
+    def query(self, query_embeddings, n_results: int, where: Optional[dict] = None) -> Dict[str, list]:
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: int = 0, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        return self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=list(include))
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def stats(self) -> dict:
+        return {"chunks": self.count()}
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluate the subset of Chroma's where syntax the app uses ($and, $or, $eq, $ne, $in)."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def top_k(scores: np.ndarray, k: int):
+    """Column indices and values of the k best scores in each row, best first."""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class NumpyFlatIndex:
+    """Exact cosine search over a float32 matrix held in memory.
+
+    Rows are L2-normalized on insert, so a query is one matrix product
+    followed by argpartition for the top k. Storage is append-only: vectors
+    go to vectors.f32 (memory-mapped on load) and every add or delete is a
+    line in rows.jsonl. Replacing or deleting a chunk only tombstones its old
+    row; the files are compacted once more than half the rows are dead.
+
+    With INDEX_QUANTIZATION or INDEX_REDUCTION set, the compressor is fitted
+    once the index holds INDEX_COMPRESSION_MIN_ROWS rows, and every row also
+    gets a compact code in codes.bin. The scan then runs over the codes, and
+    only the best k * INDEX_RESCORE_FACTOR candidates are re-scored with
+    their full-precision vectors. The float32 file stays mapped but only the
+    candidate rows are read from it.
+    """
+
+    def __init__(self, path: Path = NUMPY_INDEX_DIR, compressor: Optional[VectorCompressor] = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.path / "vectors.f32"
+        self.codes_path = self.path / "codes.bin"
+        self.compressor_path = self.path / "compressor.npz"
+        self.rows_path = self.path / "rows.jsonl"
+        self.meta_path = self.path / "meta.json"
+        self.compressor = compressor or VectorCompressor()
+        self.compression_min_rows = int(os.getenv("INDEX_COMPRESSION_MIN_ROWS", "10000"))
+        self.rescore_factor = int(os.getenv("INDEX_RESCORE_FACTOR", "4"))
+        self.codes: Optional[np.ndarray] = None
+        self.dimension: Optional[int] = None
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.row_of: Dict[str, int] = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        # Filter masks by filter JSON, least recently used first
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.mask_cache_size = int(os.getenv("NUMPY_INDEX_MASK_CACHE_SIZE", "64"))
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.meta_path.exists():
+            return
+        self.dimension = json.loads(self.meta_path.read_text(encoding="utf-8"))["dimension"]
+        alive = []
+        with open(self.rows_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["op"] == "add":
+                    self._tombstone(record["id"], alive)
+                    self.row_of[record["id"]] = len(self.ids)
+                    self.ids.append(record["id"])
+                    self.texts.append(record["text"])
+                    self.metadatas.append(record["metadata"])
+                    alive.append(True)
+                else:
+                    self._tombstone(record["id"], alive)
+        self.alive = np.array(alive, dtype=bool)
+        self._map_vectors()
+        self._load_compressor()
+        logger.info(f"Loaded NumPy index with {self.count()} chunks ({len(self.ids)} rows) from {self.path}")
+
+    def _tombstone(self, chunk_id: str, alive) -> None:
+        row = self.row_of.pop(chunk_id, None)
+        if row is not None:
+            alive[row] = False
+
+    def _map_vectors(self) -> None:
+        rows = len(self.ids)
+        if rows and self.dimension:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        else:
+            self.matrix = np.zeros((0, self.dimension or 0), dtype=np.float32)
+        if self.compressor.fitted and rows:
+            self.codes = np.memmap(self.codes_path, dtype=self.compressor.code_dtype, mode="r",
+                                   shape=(rows, self.compressor.code_dimensions))
+
+    def _load_compressor(self) -> None:
+        if not self.compressor.enabled:
+            return
+        if self.compressor_path.exists():
+            stored = VectorCompressor.load(self.compressor_path)
+            expected_bytes = len(self.ids) * stored.bytes_per_vector
+            # Settings changed, or codes lag behind vectors after a crash: refit
+            if (stored.settings == self.compressor.settings and self.codes_path.exists()
+                    and self.codes_path.stat().st_size == expected_bytes):
+                self.compressor = stored
+                self._map_vectors()
+                return
+        self._maybe_fit_compressor()
+
+    def _maybe_fit_compressor(self) -> None:
+        live = np.flatnonzero(self.alive)
+        if not self.compressor.enabled or len(live) < self.compression_min_rows:
+            return
+        sample = np.random.default_rng(0).choice(live, min(len(live), 20000), replace=False)
+        self.compressor = VectorCompressor(**self.compressor.settings).fit(self.matrix[np.sort(sample)])
+        self._write_codes(np.arange(len(self.ids)))
+        self.compressor.save(self.compressor_path)
+        self._map_vectors()
+
+    def _write_codes(self, rows: np.ndarray) -> None:
+        """Encode the given rows into a fresh codes.bin, a block at a time."""
+        self.codes = None
+        tmp_codes = self.codes_path.with_suffix(".tmp")
+        with open(tmp_codes, "wb") as f:
+            for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+                f.write(self.compressor.encode(self.matrix[rows[start:start + SCORE_BLOCK_ROWS]]).tobytes())
+        os.replace(tmp_codes, self.codes_path)
+
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[dict], embeddings) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got shape {vectors.shape}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                self.meta_path.write_text(json.dumps({"dimension": self.dimension}), encoding="utf-8")
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Index holds {self.dimension}-dim vectors, got {vectors.shape[1]}")
+
+            alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+            with open(self.vectors_path, "ab") as vf, open(self.rows_path, "a", encoding="utf-8") as rf:
+                vf.write(vectors.tobytes())
+                if self.compressor.fitted:
+                    with open(self.codes_path, "ab") as cf:
+                        cf.write(self.compressor.encode(vectors).tobytes())
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    self._tombstone(chunk_id, alive)
+                    self.row_of[chunk_id] = len(self.ids)
+                    self.ids.append(chunk_id)
+                    self.texts.append(text)
+                    self.metadatas.append(metadata or {})
+                    rf.write(json.dumps({"op": "add", "id": chunk_id, "text": text, "metadata": metadata or {}}) + "\n")
+            self.alive = alive
+            self._masks.clear()
+            self._map_vectors()
+            if not self.compressor.fitted:
+                self._maybe_fit_compressor()
+            self._maybe_compact()
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            with open(self.rows_path, "a", encoding="utf-8") as rf:
+                for chunk_id in ids:
+                    row = self.row_of.pop(chunk_id, None)
+                    if row is not None:
+                        self.alive[row] = False
+                        rf.write(json.dumps({"op": "delete", "id": chunk_id}) + "\n")
+            self._masks.clear()
+            self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        live = int(self.alive.sum())
+        if len(self.ids) < 1000 or live * 2 >= len(self.ids):
+            return
+        keep = np.flatnonzero(self.alive)
+        vectors = np.array(self.matrix[keep])
+        tmp_vectors = self.vectors_path.with_suffix(".tmp")
+        tmp_rows = self.rows_path.with_suffix(".tmp")
+        tmp_vectors.write_bytes(vectors.tobytes())
+        with open(tmp_rows, "w", encoding="utf-8") as rf:
+            for row in keep:
+                rf.write(json.dumps({
+                    "op": "add", "id": self.ids[row], "text": self.texts[row], "metadata": self.metadatas[row]
+                }) + "\n")
+        if self.compressor.fitted:
+            self._write_codes(keep)
+        self.matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_rows, self.rows_path)
+
+        self.ids = [self.ids[row] for row in keep]
+        self.texts = [self.texts[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        self.row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self._map_vectors()
+        logger.info("Compacted NumPy index to %d rows", len(self.ids))
+
+    def _mask(self, where: Optional[dict]) -> np.ndarray:
+        """Rows that are alive and match the filter; cached until the index changes."""
+        if not where:
+            return self.alive
+        key = json.dumps(where, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self.alive & np.fromiter(
+                (matches_where(metadata, where) for metadata in self.metadatas), dtype=bool, count=len(self.metadatas)
+            )
+            self._masks[key] = mask
+            while len(self._masks) > self.mask_cache_size:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(key)
+        return mask
+
+    def search(self, query_embeddings, n_results: int, where: Optional[dict] = None):
+        """Top-k rows per query as (row indices, cosine scores), best first."""
+        rows, scores, _ = self._search(query_embeddings, n_results, where)
+        return rows, scores
+
+    def _search(self, query_embeddings, n_results: int, where: Optional[dict]):
+        """Search one consistent view of the index; also return that view's (ids, texts, metadatas).
+
+        Compaction renumbers rows by swapping in new lists and files, while
+        appends only extend the current ones, so rows found in the captured
+        view always resolve against the captured lists. The scan itself runs
+        without the lock.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            matrix, codes, compressor = self.matrix, self.codes, self.compressor
+            # Deletes flip alive in place, so work on a copy
+            mask = self._mask(where).copy()
+            view = (self.ids, self.texts, self.metadatas)
+        rows, scores = self._rank(queries, n_results, matrix, codes, compressor, mask)
+        return rows, scores, view
+
+    def _rank(self, queries, n_results, matrix, codes, compressor, mask):
+        candidates = int(mask.sum())
+        k = min(n_results, candidates)
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty
+
+        if codes is None:
+            scores = queries @ matrix.T
+            if candidates < len(mask):
+                scores[:, ~mask] = -np.inf
+            return top_k(scores, k)
+
+        approximate = compressor.scores(queries, codes)
+        if candidates < len(mask):
+            approximate[:, ~mask] = -np.inf
+        shortlist, _ = top_k(approximate, min(k * self.rescore_factor, candidates))
+        # Re-score the shortlist with the full-precision rows
+        full = matrix[shortlist.ravel()].reshape(shortlist.shape + (matrix.shape[1],))
+        exact = np.einsum("qcd,qd->qc", full, queries)
+        order, scores = top_k(exact, k)
+        return np.take_along_axis(shortlist, order, axis=1), scores
+
+    def query(self, query_embeddings, n_results: int, where: Optional[dict] = None) -> Dict[str, list]:
+        rows, scores, (ids, texts, metadatas) = self._search(query_embeddings, n_results, where)
+        logger.info("NumPy index searched %d queries over %d rows", len(rows), len(ids), extra=SAMPLED)
+        return {
+            "ids": [[ids[row] for row in ranked] for ranked in rows],
+            "documents": [[texts[row] for row in ranked] for ranked in rows],
+            "metadatas": [[metadatas[row] for row in ranked] for ranked in rows],
+            "distances": [(1 - ranked).tolist() for ranked in scores],
+        }
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: int = 0, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        with self._lock:
+            if ids is not None:
+                rows = [self.row_of[chunk_id] for chunk_id in ids if chunk_id in self.row_of]
+                rows = [row for row in rows if where is None or matches_where(self.metadatas[row], where)]
+            else:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            rows = rows[offset:offset + limit if limit is not None else None]
+            return {
+                "ids": [self.ids[row] for row in rows],
+                "documents": [self.texts[row] for row in rows] if "documents" in include else None,
+                "metadatas": [self.metadatas[row] for row in rows] if "metadatas" in include else None,
+                "embeddings": np.array(self.matrix[rows]) if "embeddings" in include else None,
+            }
+
+    def count(self) -> int:
+        return int(self.alive.sum())
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.count(),
+            "rows": len(self.ids),
+            "dimension": self.dimension,
+            "matrix_mb": round(self.matrix.nbytes / 1024 / 1024, 2),
+            "codes_mb": round(self.codes.nbytes / 1024 / 1024, 2) if self.codes is not None else None,
+            "compression": self.compressor.stats(),
+        }
+
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+
+def create_backend(name: str, embeddings):
+    """Open (or create) the on-disk index for VECTOR_BACKEND."""
+    if name == "numpy":
+        return NumpyFlatIndex()
+    return ChromaBackend(embeddings)
@@ -0,0 +1,131 @@
+from pathlib import Path
+from typing import Optional
+import os
+import numpy as np
+from .logger import Logger
+
+logger = Logger.get_logger('vector_compression')
+
+QUANTIZATIONS = ("none", "int8")
+REDUCTIONS = ("none", "pca", "prefix")
+SCORE_BLOCK_ROWS = 65536
+
+
+class VectorCompressor:
+    """Compact codes for the search scan, fitted on the vectors being indexed.
+
+    Vectors are first reduced, either by projecting onto the top principal
+    directions of the sample or by keeping a prefix of the dimensions (which
+    suits Matryoshka-trained models). Then each dimension can be quantized
+    to int8 with a symmetric per-dimension scale. The PCA is uncentered, so
+    dot products between codes stay approximations of the original cosine
+    scores and rankings carry over without per-row correction terms.
+    """
+
+    def __init__(self, quantization: Optional[str] = None, reduction: Optional[str] = None,
+                 dimensions: Optional[int] = None):
+        self.quantization = (quantization or os.getenv("INDEX_QUANTIZATION", "none")).lower()
+        self.reduction = (reduction or os.getenv("INDEX_REDUCTION", "none")).lower()
+        self.dimensions = dimensions or int(os.getenv("INDEX_REDUCED_DIMENSIONS", "256"))
+        if self.quantization not in QUANTIZATIONS:
+            logger.warning(f"Unknown INDEX_QUANTIZATION {self.quantization}, storing float32")
+            self.quantization = "none"
+        if self.reduction not in REDUCTIONS:
+            logger.warning(f"Unknown INDEX_REDUCTION {self.reduction}, keeping all dimensions")
+            self.reduction = "none"
+        self.components: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.input_dimensions: Optional[int] = None
+        self.fitted = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.quantization != "none" or self.reduction != "none"
+
+    @property
+    def settings(self) -> dict:
+        return {"quantization": self.quantization, "reduction": self.reduction, "dimensions": self.dimensions}
+
+    @property
+    def code_dtype(self):
+        return np.int8 if self.quantization == "int8" else np.float32
+
+    @property
+    def code_dimensions(self) -> int:
+        if self.reduction == "none":
+            return self.input_dimensions
+        return min(self.dimensions, self.input_dimensions)
+
+    def fit(self, vectors: np.ndarray) -> "VectorCompressor":
+        sample = np.asarray(vectors, dtype=np.float32)
+        self.input_dimensions = sample.shape[1]
+        if self.reduction == "pca":
+            # Eigenvectors of the second-moment matrix, largest first
+            _, eigenvectors = np.linalg.eigh(sample.T.astype(np.float64) @ sample)
+            self.components = eigenvectors[:, ::-1][:, :self.code_dimensions].astype(np.float32)
+        if self.quantization == "int8":
+            # Clip the rare outliers rather than spend the int8 range on them
+            bound = np.percentile(np.abs(self.reduce(sample)), 99.9, axis=0)
+            self.scale = np.where(bound > 0, bound / 127, 1).astype(np.float32)
+        self.fitted = True
+        logger.info(
+            f"Fitted {self.reduction}/{self.quantization} compression on {len(sample)} vectors: "
+            f"{self.input_dimensions} -> {self.code_dimensions} dims, {self.bytes_per_vector} bytes per vector"
+        )
+        return self
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        if self.reduction == "pca":
+            return vectors @ self.components
+        if self.reduction == "prefix":
+            return np.ascontiguousarray(vectors[:, :self.code_dimensions])
+        return vectors
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        reduced = self.reduce(np.asarray(vectors, dtype=np.float32))
+        if self.quantization == "int8":
+            return np.clip(np.rint(reduced / self.scale), -127, 127).astype(np.int8)
+        return reduced.astype(np.float32)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate query-by-row dot products computed from the codes alone."""
+        projected = self.reduce(queries)
+        if self.quantization == "int8":
+            projected = projected * self.scale
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        # int8 blocks are widened a slice at a time to bound the temporary copy
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            scores[:, start:start + len(block)] = projected @ block.astype(np.float32, copy=False).T
+        return scores
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.code_dimensions * np.dtype(self.code_dtype).itemsize
+
+    def save(self, path: Path) -> None:
+        arrays = {"input_dimensions": np.array(self.input_dimensions)}
+        if self.components is not None:
+            arrays["components"] = self.components
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        with open(path, "wb") as f:
+            np.savez(f, quantization=self.quantization, reduction=self.reduction,
+                     dimensions=np.array(self.dimensions), **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorCompressor":
+        with np.load(path) as data:
+            compressor = cls(str(data["quantization"]), str(data["reduction"]), int(data["dimensions"]))
+            compressor.input_dimensions = int(data["input_dimensions"])
+            compressor.components = data["components"] if "components" in data else None
+            compressor.scale = data["scale"] if "scale" in data else None
+        compressor.fitted = True
+        return compressor
+
+    def stats(self) -> dict:
+        stats = dict(self.settings, fitted=self.fitted)
+        if self.fitted:
+            stats["code_dimensions"] = self.code_dimensions
+            stats["bytes_per_vector"] = self.bytes_per_vector
+        return stats
@@ -0,0 +1,115 @@
+"""Crawl cache behaviour against a local fixture server, so no test touches the network."""
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from src.crawl_cache import CrawlCache
+from src.crawler import SiteCrawler
+
+ETAG = '"v1"'
+PAGE = "<html><head><title>Fixture</title></head><body><p>Cached fixture page</p></body></html>"
+
+
+class FixtureServer:
+    """One HTML page with an ETag that answers a matching If-None-Match with 304."""
+
+    def __init__(self):
+        self.robots = ""
+        self.requests = []
+        self.app = web.Application()
+        self.app.router.add_get("/robots.txt", self.robots_txt)
+        self.app.router.add_get("/page", self.page)
+        self.runner = None
+        self.url = None
+
+    async def robots_txt(self, request):
+        return web.Response(text=self.robots)
+
+    async def page(self, request):
+        if request.headers.get("If-None-Match") == ETAG:
+            self.requests.append(304)
+            return web.Response(status=304, headers={"ETag": ETAG})
+        self.requests.append(200)
+        return web.Response(text=PAGE, content_type="text/html", headers={"ETag": ETAG})
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/page"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def crawl(cache: CrawlCache, url: str):
+    async with aiohttp.ClientSession() as session:
+        crawler = SiteCrawler(session, max_depth=1, politeness_delay=0, respect_robots=True, cache=cache)
+        return await crawler.crawl(url)
+
+
+def run(scenario):
+    async def main():
+        server = FixtureServer()
+        await server.start()
+        try:
+            await scenario(server)
+        finally:
+            await server.stop()
+    asyncio.run(main())
+
+
+def test_fresh_entry_is_served_without_a_request(tmp_path):
+    cache = CrawlCache(tmp_path / "crawl.db", ttl_seconds=3600)
+
+    async def scenario(server):
+        first = await crawl(cache, server.url)
+        second = await crawl(cache, server.url)
+        assert server.requests == [200]
+        assert [page.text for page in second] == [page.text for page in first]
+        assert "Cached fixture page" in second[0].text
+        assert cache.fresh_hits == 1
+
+    run(scenario)
+
+
+def test_stale_entry_is_revalidated_with_its_etag(tmp_path):
+    cache = CrawlCache(tmp_path / "crawl.db", ttl_seconds=0)
+
+    async def scenario(server):
+        first = await crawl(cache, server.url)
+        second = await crawl(cache, server.url)
+        assert server.requests == [200, 304]
+        assert second[0].text == first[0].text
+        assert cache.revalidated == 1
+
+    run(scenario)
+
+
+def test_cached_page_is_served_offline(tmp_path):
+    cache = CrawlCache(tmp_path / "crawl.db", ttl_seconds=3600)
+
+    async def scenario(server):
+        url = server.url
+        await crawl(cache, url)
+        await server.stop()
+        pages = await crawl(cache, url)
+        assert "Cached fixture page" in pages[0].text
+        await server.start()
+
+    run(scenario)
+
+
+def test_robots_disallow_applies_to_cached_pages(tmp_path):
+    cache = CrawlCache(tmp_path / "crawl.db", ttl_seconds=3600)
+
+    async def scenario(server):
+        assert await crawl(cache, server.url)
+        server.robots = "User-agent: *\nDisallow: /page\n"
+        assert await crawl(cache, server.url) == []
+        assert server.requests == [200]
+
+    run(scenario)